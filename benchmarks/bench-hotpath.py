@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Benchmark the SSE -> signal -> OBS hot path against local fake endpoints.
+
+Events flow through `server_sent_events`, `SSEProcessor.process_events`, and a
+real `OBSManager` connected to a fake OBS websocket server.  Reports events
+per second, end-to-end latency percentiles, and peak memory usage.
+"""
+
+import resource
+import statistics
+import threading
+import time
+from typing import Any
+
+import click
+from fakes import FakeMinifox, FakeOBS
+
+from watchfox.dispatch import ShardedDispatcher
+from watchfox.minifox import SSEProcessor
+from watchfox.obs import OBSClient, OBSClientPool, OBSManager, OBSStateCache
+from watchfox.sse import server_sent_events
+
+SCENARIOS: dict[str, dict[str, float]] = {
+    'balanced': {'match_move': 1.0, 'match_time': 1.0, 'match_chat': 1.0},
+    'clock': {'match_move': 1.0, 'match_time': 10.0, 'match_chat': 0.0},
+    'chat-flood': {'match_move': 1.0, 'match_time': 1.0, 'match_chat': 20.0},
+}
+
+
+class LatencyProbe:
+    def __init__(self, batch: bool = False):
+        super().__init__()
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+
+    def __call__(self, name: str, processor: SSEProcessor, data: Any):
+        manager = processor.manager
+        match name:
+            case 'match_move' if self.batch:
+                with manager.batch():
+                    manager.filter.enable('board', 'highlight')
+                    manager.media.restart('stone')
+            case 'match_move':
+                manager.filter.enable('board', 'highlight')
+                manager.media.restart('stone')
+            case 'match_time':
+                manager.filter.disable('clock', 'warning')
+            case 'match_chat':
+                manager.hotkey.trigger_by_name('chat')
+
+        latency = time.perf_counter() - data['bench_sent']
+        with self.lock:
+            self.latencies.append(latency)
+
+
+def connect_probe(probe: LatencyProbe):
+    for name, signal in SSEProcessor.signals.items():
+
+        def receiver(processor: SSEProcessor, data: Any, name=name):
+            probe(name, processor, data)
+
+        signal.connect(receiver, weak=False)
+
+
+def percentile(values: list[float], p: float) -> float:
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+@click.command()
+@click.option(
+    '--scenario',
+    type=click.Choice(list(SCENARIOS)),
+    default='balanced',
+    help='Mix of generated events.',
+)
+@click.option('--rate', type=float, default=500.0, help='Events per second.')
+@click.option('--count', type=int, default=5000, help='Number of events.')
+@click.option('--matches', type=int, default=4, help='Number of simultaneous matches.')
+@click.option(
+    '--obs-latency',
+    type=float,
+    default=0.0,
+    help='Seconds the fake OBS server takes per request.',
+)
+@click.option(
+    '--obs-connections',
+    type=int,
+    default=1,
+    help='Maximum number of concurrent OBS connections.',
+)
+@click.option(
+    '--obs-cache',
+    is_flag=True,
+    help='Skip OBS requests which would not change the OBS state.',
+)
+@click.option(
+    '--batch',
+    is_flag=True,
+    help='Send the OBS requests of each move as a single batch.',
+)
+@click.option(
+    '--workers',
+    type=int,
+    default=0,
+    help='Number of dispatch threads (0 dispatches inline).',
+)
+def main(
+    scenario: str,
+    rate: float,
+    count: int,
+    matches: int,
+    obs_latency: float,
+    obs_connections: int,
+    obs_cache: bool,
+    batch: bool,
+    workers: int,
+):
+    """Run the hot path benchmark."""
+    minifox = FakeMinifox(
+        rate=rate,
+        count=count,
+        matches=matches,
+        weights=SCENARIOS[scenario],
+    )
+    obs = FakeOBS(latency=obs_latency)
+    minifox.start()
+    obs.start()
+
+    probe = LatencyProbe(batch)
+    connect_probe(probe)
+
+    pool = OBSClientPool(
+        lambda: OBSClient(host=obs.host, port=obs.port, password=''),
+        obs_connections,
+    )
+    manager = OBSManager(pool, OBSStateCache() if obs_cache else None)
+    dispatcher = ShardedDispatcher(workers) if workers > 0 else None
+    processor = SSEProcessor(manager, dispatcher=dispatcher)
+
+    start = time.perf_counter()
+    processor.process_events(server_sent_events(minifox.url, reconnect=False))
+    elapsed = time.perf_counter() - start
+
+    minifox.stop()
+    obs.stop()
+
+    latencies = probe.latencies
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f'{scenario=} {rate=} {count=} {matches=} {obs_latency=}')
+    print(f'{obs_connections=} {obs_cache=} {batch=} {workers=}')
+    print(f'events:       {len(latencies)}')
+    print(f'obs requests: {obs.requests}')
+    print(f'throughput:   {len(latencies) / elapsed:.1f} events/s')
+    print(f'latency p50:  {1000 * percentile(latencies, 50):.3f} ms')
+    print(f'latency p99:  {1000 * percentile(latencies, 99):.3f} ms')
+    print(f'peak memory:  {maxrss / 1024:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
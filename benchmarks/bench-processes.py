@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Check that the process pool keeps up with a producer faster than OBS.
+
+All events belong to a single match, so they go to the same worker, whose
+CPU-bound receiver makes an OBS request per event;  the manager takes a while
+to apply each request, so that the pipes to and from the worker fill up.  Exits
+with a non-zero status if the events are not all handled within the timeout
+(e.g., if the pool deadlocks), or if their effects are not applied in order.
+"""
+
+import sys
+import time
+from threading import Thread
+from typing import Any
+
+import click
+
+from watchfox.minifox import SSEProcessor
+from watchfox.processes import ProcessPool, cpu_bound
+
+
+class SlowManager:
+    """Stand-in for the `OBSManager`, taking `delay` seconds per request."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.media = self
+        self.restarted: list[str] = []
+
+    def restart(self, name: str):
+        time.sleep(self.delay)
+        self.restarted.append(name)
+
+
+@SSEProcessor.match_move.connect
+@cpu_bound
+def on_match_move(processor, data, state, **kwargs):
+    processor.manager.media.restart(f'move-{len(state.moves)}')
+
+
+def make_match_move(number: int, padding: int) -> dict[str, Any]:
+    return {
+        'id': 'bench',
+        'move': [-1, -1],
+        'move_number': number,
+        'turn': 'B' if number % 2 == 0 else 'W',
+        'padding': 'x' * padding,
+    }
+
+
+@click.command()
+@click.option('--events', type=click.IntRange(min=1), default=3000, show_default=True)
+@click.option(
+    '--delay',
+    type=click.FloatRange(min=0),
+    default=0.001,
+    show_default=True,
+    help='Seconds taken by the manager per request.',
+)
+@click.option(
+    '--padding',
+    type=click.IntRange(min=0),
+    default=256,
+    show_default=True,
+    help='Extra bytes per event.',
+)
+@click.option('--timeout', type=click.FloatRange(min=0), default=60, show_default=True)
+def main(events: int, delay: float, padding: int, timeout: float):
+    manager = SlowManager(delay)
+    pool = ProcessPool(manager, workers=1)  # type: ignore
+    processor = SSEProcessor(manager, track_state=True, pool=pool)  # type: ignore
+
+    def produce():
+        for number in range(events):
+            processor.handle('match_move', make_match_move(number, padding))
+        pool.join()
+
+    start = time.perf_counter()
+    producer = Thread(target=produce, daemon=True)
+    producer.start()
+    producer.join(timeout)
+    elapsed = time.perf_counter() - start
+
+    if producer.is_alive():
+        print(
+            f'stalled after {timeout:.0f}s, with {len(manager.restarted)}/{events} '
+            'events handled'
+        )
+        sys.exit(1)
+
+    print(f'handled {events} events in {elapsed:.2f}s')
+    if manager.restarted != [f'move-{number + 1}' for number in range(events)]:
+        print('effects applied out of order')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
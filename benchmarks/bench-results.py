@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""Micro-benchmark `parse_result`, with and without its cache."""
+
+import timeit
+from functools import partial
+
+import click
+
+from watchfox.utils import parse_result
+
+RESULTS: list[str] = [
+    'Draw',
+    'B+ Resign',
+    'W+ Resign',
+    'B+R',
+    'W+ Time',
+    'B+F',
+    'B+12.5',
+    'W+ 3.5 points',
+]
+
+
+@click.command()
+@click.option('--number', type=click.IntRange(min=1), default=100_000)
+def main(number: int):
+    uncached = parse_result.__wrapped__
+
+    for name, parse in [('uncached', uncached), ('cached', parse_result)]:
+        parse_result.cache_clear()
+        for result in RESULTS:
+            call = partial(parse, result)
+            seconds = min(timeit.repeat(call, number=number, repeat=3))
+            print(f'{name:10} {result!r:18} {seconds / number * 1e9:8.0f} ns/call')
+
+
+if __name__ == '__main__':
+    main()
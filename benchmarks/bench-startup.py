@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Check the import time of the CLI, and what each subcommand imports.
+
+Every measurement runs in a fresh interpreter (`python -X importtime`), and
+the best of several runs is compared against the budget.  Exits with a non-zero
+status if the budget is exceeded, or if a subcommand imports a dependency it
+does not need (e.g., `record` importing the OBS websocket client).
+"""
+
+import re
+import subprocess
+import sys
+
+import click
+
+# modules imported by each code path, and dependencies they must not import
+IMPORT_CHECKS: dict[str, tuple[list[str], list[str]]] = {
+    'cli': (
+        ['watchfox.cli'],
+        ['httpx', 'httpx_sse', 'obsws_python', 'blinker', 'asyncio', 'websocket'],
+    ),
+    'record': (
+        ['watchfox.cli', 'watchfox.sse'],
+        ['obsws_python', 'blinker', 'websocket'],
+    ),
+    'replay --mock-obs': (
+        ['watchfox.cli', 'watchfox.minifox', 'watchfox.recording', 'watchfox.utils'],
+        ['obsws_python', 'httpx', 'websocket'],
+    ),
+}
+
+
+def import_time(modules: list[str]) -> tuple[float, set[str]]:
+    """Import time in seconds of `modules`, and all the modules imported."""
+    code = ';'.join(f'import {module}' for module in modules)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    total = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if match is None:
+            continue
+
+        imported.add(match[4])
+        # top-level imports have a single space of indentation
+        if len(match[3]) == 1:
+            total += int(match[2])
+
+    return total / 1e6, imported
+
+
+@click.command()
+@click.option('--runs', type=click.IntRange(min=1), default=5, show_default=True)
+@click.option(
+    '--budget',
+    type=click.FloatRange(min=0),
+    default=150.0,
+    show_default=True,
+    help='Maximum import time of each code path, in milliseconds.',
+)
+def main(runs: int, budget: float):
+    failed = False
+
+    for name, (modules, forbidden) in IMPORT_CHECKS.items():
+        times = []
+        for _ in range(runs):
+            elapsed, imported = import_time(modules)
+            times.append(elapsed)
+
+        best = min(times) * 1000
+        unexpected = sorted(module for module in forbidden if module in imported)
+        ok = best <= budget and not unexpected
+        failed |= not ok
+
+        print(f'{name:20} {best:7.1f} ms  {"ok" if ok else "FAILED"}')
+        if unexpected:
+            print(f'{"":20} unexpected imports: {", ".join(unexpected)}')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
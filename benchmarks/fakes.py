@@ -0,0 +1,310 @@
+"""Fake minifox and OBS endpoints for benchmarking.
+
+`FakeMinifox` serves a synthetic server-sent-event stream over HTTP, and
+`FakeOBS` implements enough of the obs-websocket (v5) protocol for
+`obsws_python.ReqClient` to connect and send requests.  Both run in background
+threads of the benchmarking process.
+"""
+
+import base64
+import hashlib
+import itertools as itt
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def make_match_start(id: str) -> dict[str, Any]:
+    def player(nick: str) -> dict[str, Any]:
+        return {'avatar': '', 'country': 'xx', 'nick': nick, 'rank': '5d'}
+
+    return {
+        'id': id,
+        'black': player(f'black-{id}'),
+        'white': player(f'white-{id}'),
+        'settings': {
+            'board_size': 19,
+            'chinese_rules': True,
+            'handicap': 0,
+            'komi': 7,
+        },
+        'time_control': {'byoyomi_periods': 3, 'byoyomi_time': 30, 'main_time': 600},
+    }
+
+
+def make_match_move(id: str, move_number: int) -> dict[str, Any]:
+    return {
+        'id': id,
+        'move': [random.randrange(19), random.randrange(19)],
+        'move_number': move_number,
+        'turn': 'B' if move_number % 2 == 1 else 'W',
+    }
+
+
+def make_match_time(id: str) -> dict[str, Any]:
+    def clock() -> dict[str, Any]:
+        return {
+            'byoyomi': 3,
+            'byoyomi_time': 30,
+            'connected': True,
+            'disconnected_time': 0,
+            'main_time': random.randrange(600),
+        }
+
+    return {'id': id, 'black_time': clock(), 'white_time': clock()}
+
+
+def make_match_chat(id: str) -> dict[str, Any]:
+    return {
+        'id': id,
+        'country': 'xx',
+        'nick': f'viewer-{random.randrange(1000)}',
+        'rank': '1k',
+        'message': 'nice move!',
+    }
+
+
+class FakeMinifox:
+    """Serves synthetic minifox events at a fixed rate.
+
+    Every connection first receives a `match_start` for each match, followed
+    by `count` events randomly drawn according to `weights` and spread over
+    the matches, and finally a `match_end` for each match.  Each event data
+    carries a `bench_sent` field with the `time.perf_counter()` at which it was
+    sent, to measure end-to-end latency within the same process.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = 100.0,
+        count: int = 1000,
+        matches: int = 1,
+        weights: dict[str, float] | None = None,
+        host: str = 'localhost',
+        port: int = 0,
+    ):
+        super().__init__()
+        self.rate = rate
+        self.count = count
+        self.ids = [f'match-{i}' for i in range(matches)]
+        self.weights = (
+            {'match_move': 1.0, 'match_time': 1.0, 'match_chat': 1.0}
+            if weights is None
+            else weights
+        )
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                try:
+                    fake.stream(self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def events(self):
+        for id in self.ids:
+            yield 'match_start', make_match_start(id)
+
+        names = list(self.weights)
+        weights = list(self.weights.values())
+        move_numbers = dict.fromkeys(self.ids, 0)
+        for _ in range(self.count):
+            id = random.choice(self.ids)
+            [name] = random.choices(names, weights)
+            match name:
+                case 'match_move':
+                    move_numbers[id] += 1
+                    yield name, make_match_move(id, move_numbers[id])
+                case 'match_time':
+                    yield name, make_match_time(id)
+                case 'match_chat':
+                    yield name, make_match_chat(id)
+
+        for id in self.ids:
+            yield 'match_end', {'id': id, 'result': 'B+ Resign'}
+
+    def stream(self, wfile):
+        clock0 = time.monotonic()
+        for i, (name, data) in enumerate(self.events()):
+            delay = clock0 + i / self.rate - time.monotonic()
+            if delay > 0.0:
+                time.sleep(delay)
+
+            data['bench_sent'] = time.perf_counter()
+            wfile.write(f'event: {name}\ndata: {json.dumps(data)}\n\n'.encode())
+            wfile.flush()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeOBS:
+    """Minimal obs-websocket server which acknowledges every request.
+
+    Each request succeeds after `latency` seconds with empty response data;
+    the number of received requests is kept in `requests`.
+    """
+
+    def __init__(self, *, latency: float = 0.0, host: str = 'localhost', port: int = 0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.socket = socket.create_server((host, port))
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.running = False
+
+    @property
+    def host(self) -> str:
+        return self.socket.getsockname()[0]
+
+    @property
+    def port(self) -> int:
+        return self.socket.getsockname()[1]
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.socket.close()
+
+    def serve(self):
+        while self.running:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                break
+
+            threading.Thread(
+                target=self.handle,
+                args=(connection,),
+                daemon=True,
+            ).start()
+
+    def handle(self, connection: socket.socket):
+        with connection, connection.makefile('rb') as rfile:
+            self.handshake(connection, rfile)
+            self.send(connection, {'op': 0, 'd': {'rpcVersion': 1}})
+
+            while (message := self.recv(connection, rfile)) is not None:
+                response = self.respond(message)
+                if response is not None:
+                    self.send(connection, response)
+
+    def respond(self, message: dict[str, Any]) -> dict[str, Any] | None:
+        op, d = message['op'], message['d']
+        match op:
+            case 1:  # Identify
+                return {'op': 2, 'd': {'negotiatedRpcVersion': 1}}
+
+            case 6:  # Request
+                return {'op': 7, 'd': self.process_request(d)}
+
+            case 8:  # RequestBatch
+                results = [self.process_request(request) for request in d['requests']]
+                return {'op': 9, 'd': {'requestId': d['requestId'], 'results': results}}
+
+        return None
+
+    def process_request(self, request: dict[str, Any]) -> dict[str, Any]:
+        if self.latency > 0.0:
+            time.sleep(self.latency)
+
+        with self.lock:
+            self.requests += 1
+
+        return {
+            'requestType': request['requestType'],
+            'requestId': request.get('requestId', ''),
+            'requestStatus': {'result': True, 'code': 100},
+            'responseData': {},
+        }
+
+    @staticmethod
+    def handshake(connection: socket.socket, rfile):
+        headers = {}
+        for line in itt.takewhile(lambda line: line.strip(), rfile):
+            key, _, value = line.decode().partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        key = headers['sec-websocket-key'] + WEBSOCKET_GUID
+        accept = base64.b64encode(hashlib.sha1(key.encode()).digest()).decode()
+        connection.sendall(
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n'
+            '\r\n'.encode()
+        )
+
+    @staticmethod
+    def recv(connection: socket.socket, rfile) -> dict[str, Any] | None:
+        while True:
+            header = rfile.read(2)
+            if len(header) < 2:
+                return None
+
+            opcode = header[0] & 0x0F
+            size = header[1] & 0x7F
+            if size == 126:
+                [size] = struct.unpack('>H', rfile.read(2))
+            elif size == 127:
+                [size] = struct.unpack('>Q', rfile.read(8))
+
+            mask = rfile.read(4) if header[1] & 0x80 else b'\x00' * 4
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(rfile.read(size)))
+
+            match opcode:
+                case 0x1:  # text
+                    return json.loads(payload)
+                case 0x8:  # close
+                    return None
+                case 0x9:  # ping
+                    FakeOBS.send_frame(connection, 0xA, payload)
+
+    @staticmethod
+    def send(connection: socket.socket, message: dict[str, Any]):
+        FakeOBS.send_frame(connection, 0x1, json.dumps(message).encode())
+
+    @staticmethod
+    def send_frame(connection: socket.socket, opcode: int, payload: bytes):
+        size = len(payload)
+        if size < 126:
+            header = struct.pack('>BB', 0x80 | opcode, size)
+        elif size < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, size)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, size)
+
+        connection.sendall(header + payload)
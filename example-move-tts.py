@@ -1,7 +1,9 @@
 #!/usr/bin/env python
+import glob
 import logging
+import os
 
-from watchfox.audio import play_audio
+from watchfox.audio import load_audio_bank, play_audio, preload_audio
 from watchfox.minifox import SSEProcessor
 from watchfox.obs import make_obs_manager
 from watchfox.sse import server_sent_events
@@ -21,6 +23,12 @@ def on_match_move(_: SSEProcessor, data: MinifoxMatchMove):
 
 
 if __name__ == '__main__':
+    # decodes all clips upfront, so that moves are announced without delay
+    if os.path.exists('audio.bank'):
+        load_audio_bank('audio.bank')
+    else:
+        preload_audio(glob.glob('audio/*.mp3'))
+
     # connects to real minifox
     events = server_sent_events()
 
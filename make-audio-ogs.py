@@ -2,23 +2,35 @@
 
 import asyncio
 import itertools as itt
+import logging
+import os
 import string
 
-import edge_tts
+import click
 
-LETTERS = list(string.ascii_uppercase[:20])
-LETTERS.remove('I')
-NUMBERS = list(reversed(range(1, 20)))
+from watchfox.audiogen import AudioJob, generate_audio
 
 
-def make_text(color: str, row: int, col: int):
+def make_labels(board_size: int) -> tuple[list[str], list[int]]:
+    """Make column letters and row numbers, e.g., `A` to `T` (skipping `I`) and
+    19 to 1."""
+    if not 1 < board_size <= 25:
+        raise ValueError(f'invalid {board_size=}')
+
+    letters = list(string.ascii_uppercase.replace('I', '')[:board_size])
+    numbers = list(reversed(range(1, board_size + 1)))
+    return letters, numbers
+
+
+def make_text(color: str, row: int, col: int, board_size: int = 19):
     """Make corresponding audio text, e.g., `black plays C 4`."""
     if row == -1 and col == -1:
         return f'{color} passes'
 
-    if 0 <= row < 19 and 0 <= col < 19:
-        number = NUMBERS[row]
-        letter = LETTERS[col]
+    if 0 <= row < board_size and 0 <= col < board_size:
+        letters, numbers = make_labels(board_size)
+        number = numbers[row]
+        letter = letters[col]
 
         # edge-tts pronounces `A` as an article, not as a letter;  replacing with `hay`
         if letter == 'A':
@@ -29,25 +41,73 @@ def make_text(color: str, row: int, col: int):
     raise ValueError(f'invalid inputs {color=} {row=} {col=}')
 
 
-async def save_audio(text: str, filename: str):
-    print(f'saving {text=} into {filename=}')
-    communicate = edge_tts.Communicate(text)
-    await communicate.save(filename)
+COLORS = ['white', 'black']
 
 
-COLORS = ['white', 'black']
-COORDINATES = itt.chain(
-    [(-1, -1)],
-    itt.product(range(19), range(19)),
-)
+def make_coordinates(board_size: int):
+    return itt.chain(
+        [(-1, -1)],
+        itt.product(range(board_size), range(board_size)),
+    )
 
 
-async def main():
-    for color, (row, col) in itt.product(COLORS, COORDINATES):
-        text = make_text(color, row, col)
-        filename = f'audio/{color}.{row}.{col}.mp3'
-        await save_audio(text, filename)
+def make_jobs(board_size: int, output_dir: str, voice: str | None):
+    for color, (row, col) in itt.product(COLORS, make_coordinates(board_size)):
+        text = make_text(color, row, col, board_size)
+        filename = f'{output_dir}/{color}.{row}.{col}.mp3'
+        yield AudioJob(text, filename, voice)
+
+
+@click.command()
+@click.option(
+    '--board-size',
+    type=click.IntRange(2, 25),
+    default=19,
+    help='Size of the board.',
+)
+@click.option('--output-dir', default='audio', help='Directory of the audio files.')
+@click.option('--voice', help='edge-tts voice (see `edge-tts --list-voices`).')
+@click.option(
+    '--concurrency',
+    type=click.IntRange(min=1),
+    default=8,
+    help='Concurrent requests.',
+)
+@click.option('--force', is_flag=True, help='Regenerate up-to-date files.')
+@click.option(
+    '--bank',
+    'bank_filename',
+    type=click.Path(dir_okay=False),
+    help='Also pack the decoded audio files into this audio bank.',
+)
+def main(
+    board_size: int,
+    output_dir: str,
+    voice: str | None,
+    concurrency: int,
+    force: bool,
+    bank_filename: str | None,
+):
+    jobs = list(make_jobs(board_size, output_dir, voice))
+    generated, skipped = asyncio.run(
+        generate_audio(
+            jobs,
+            manifest_filename=f'{output_dir}/manifest.json',
+            concurrency=concurrency,
+            force=force,
+        )
+    )
+    print(f'{generated=} {skipped=}')
+
+    outdated = generated > 0 or not os.path.exists(bank_filename or '')
+    if bank_filename is not None and outdated:
+        from watchfox.audiobank import build_audio_bank
+
+        print(f'building audio bank {bank_filename=}')
+        build_audio_bank(bank_filename, (job.filename for job in jobs))
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    # shows the progress of `generate_audio`
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
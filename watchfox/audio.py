@@ -1,45 +1,470 @@
+import heapq
+import itertools as itt
 import logging
-from queue import Queue
-from threading import Thread
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from functools import partial
+from threading import Condition, Event, Lock, Thread
+from typing import TYPE_CHECKING, Callable, Iterable, Literal
 
-import playsound
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst  # noqa: E402
+
+from watchfox.metrics import metrics  # noqa: E402
+
+if TYPE_CHECKING:
+    from watchfox.audiobank import AudioBank
 
 logger = logging.getLogger(__name__)
 
 
-type audiotask = str | None
-queue: Queue[audiotask]
-thread: Thread | None = None
+# all clips are decoded into this raw format
+PCM_FORMAT = 'S16LE'
+PCM_SAMPLE_SIZE = 2
+
+type PlaybackOutcome = Literal['played', 'interrupted', 'failed']
+
+
+@dataclass(frozen=True, slots=True)
+class AudioClip:
+    # memoryview for clips backed by a memory-mapped audio bank
+    pcm: bytes | memoryview
+    rate: int
+    channels: int
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.pcm)
+
+    @property
+    def duration(self) -> float:
+        return self.nbytes / (self.rate * self.channels * PCM_SAMPLE_SIZE)
+
+    @property
+    def caps(self) -> str:
+        return (
+            f'audio/x-raw,format={PCM_FORMAT},layout=interleaved,'
+            f'rate={self.rate},channels={self.channels}'
+        )
+
+
+def init_gst():
+    if not Gst.is_initialized():
+        Gst.init(None)
+
+
+def decode_audio(filename: str) -> AudioClip:
+    """Decode an audio file (e.g., mp3) into raw PCM."""
+    init_gst()
+    logger.debug(f'decoding {filename}')
+
+    pipeline = Gst.parse_launch(
+        'filesrc name=src ! decodebin ! audioconvert ! audioresample'
+        f' ! audio/x-raw,format={PCM_FORMAT},layout=interleaved'
+        ' ! appsink name=sink sync=false'
+    )
+    pipeline.get_by_name('src').set_property('location', filename)
+    sink = pipeline.get_by_name('sink')
+    bus = pipeline.get_bus()
+
+    chunks: list[bytes] = []
+    rate = channels = None
+
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        while True:
+            sample = sink.emit('try-pull-sample', 100 * Gst.MSECOND)
+            if sample is None:
+                if sink.get_property('eos'):
+                    break
+
+                message = bus.pop_filtered(Gst.MessageType.ERROR)
+                if message is not None:
+                    error, _ = message.parse_error()
+                    raise ValueError(f'failed to decode {filename=}: {error.message}')
+
+                continue
+
+            if rate is None:
+                structure = sample.get_caps().get_structure(0)
+                rate = structure.get_value('rate')
+                channels = structure.get_value('channels')
+
+            buffer = sample.get_buffer()
+            chunks.append(buffer.extract_dup(0, buffer.get_size()))
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+    if rate is None or channels is None:
+        raise ValueError(f'no audio in {filename=}')
+
+    return AudioClip(b''.join(chunks), rate, channels)
+
 
+class AudioCache:
+    """LRU cache of decoded audio clips, bounded by their total size.
 
-def play_audio_target(queue: Queue[str | None]):
-    while True:
-        filename = queue.get()
-        if filename is None:
+    Clips found in a loaded audio bank are served directly from the bank, and
+    do not count towards the cache size.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 128 * 2**20,
+        loader: Callable[[str], AudioClip] = decode_audio,
+    ):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.lock = Lock()
+        self.clips: OrderedDict[str, AudioClip] = OrderedDict()
+        self.nbytes = 0
+        self.banks: list[AudioBank] = []
+
+    def get(self, filename: str) -> AudioClip:
+        for bank in self.banks:
+            if filename in bank:
+                return bank[filename]
+
+        with self.lock:
+            try:
+                clip = self.clips[filename]
+            except KeyError:
+                pass
+            else:
+                self.clips.move_to_end(filename)
+                return clip
+
+        # decoding happens outside of the lock
+        clip = self.loader(filename)
+        self.add(filename, clip)
+        return clip
+
+    def add(self, filename: str, clip: AudioClip):
+        with self.lock:
+            if filename in self.clips:
+                return
+
+            self.clips[filename] = clip
+            self.nbytes += clip.nbytes
+
+            # the most recent clip is always kept
+            while self.nbytes > self.max_bytes and len(self.clips) > 1:
+                _, evicted = self.clips.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def preload(self, filenames: Iterable[str]):
+        for filename in filenames:
+            self.get(filename)
+
+
+class AudioPlayer:
+    """Plays decoded clips through a persistent GStreamer pipeline."""
+
+    def __init__(self):
+        super().__init__()
+        init_gst()
+        self.pipeline = Gst.parse_launch(
+            'appsrc name=src format=time ! audioconvert ! audioresample ! autoaudiosink'
+        )
+        self.src = self.pipeline.get_by_name('src')
+        self.bus = self.pipeline.get_bus()
+        self.stopped = Event()
+
+    def stop(self):
+        """Cut off the clip currently playing (if any)."""
+        self.stopped.set()
+
+    def prepare(self):
+        """Reset `stop` before the next clip is announced as playing, so that
+        stopping it right away is not lost."""
+        self.stopped.clear()
+
+    def play(self, clip: AudioClip) -> PlaybackOutcome:
+        """Play a clip until its end, or until it gets cut off or fails."""
+        # drop messages left over by the previous clip (e.g., the end-of-stream
+        # of a clip cut off right as it ended), which would end this one
+        self.bus.set_flushing(True)
+        self.bus.set_flushing(False)
+
+        self.src.set_property('caps', Gst.Caps.from_string(clip.caps))
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+        # each clip starts from running time zero after the pipeline reset
+        buffer = Gst.Buffer.new_wrapped(bytes(clip.pcm))
+        buffer.pts = 0
+        buffer.duration = int(clip.duration * Gst.SECOND)
+        self.src.emit('push-buffer', buffer)
+        self.src.emit('end-of-stream')
+
+        outcome: PlaybackOutcome = 'interrupted'
+        while not self.stopped.is_set():
+            message = self.bus.timed_pop_filtered(
+                20 * Gst.MSECOND,
+                Gst.MessageType.EOS | Gst.MessageType.ERROR,
+            )
+            if message is None:
+                continue
+
+            if message.type == Gst.MessageType.ERROR:
+                error, _ = message.parse_error()
+                logger.error('audio playback failed: %s', error.message)
+                outcome = 'failed'
+            else:
+                outcome = 'played'
             break
 
-        logger.debug(f'playing {filename}')
-        playsound.playsound(filename)
+        # clears the end-of-stream, keeping the pipeline allocated
+        self.pipeline.set_state(Gst.State.READY)
+        return outcome
+
+
+@dataclass
+class AudioQueuePolicy:
+    """How the audio queue deals with clips piling up.
+
+    - `maxsize`:  maximum number of queued clips (0 is unbounded);  when full,
+      the oldest clip with the lowest priority is dropped.
+    - `max_age`:  clips older than this many seconds when their turn comes are
+      skipped as stale.
+    - `interrupt`:  a new clip cuts off the clip currently playing, and drops
+      the queued clips, unless they have a higher priority.
+    - `late_after`:  clips starting this many seconds after being queued are
+      counted as late.
+    """
+
+    maxsize: int = 0
+    max_age: float | None = None
+    interrupt: bool = False
+    late_after: float = 0.5
 
 
-def play_audio(filename: str):
-    global thread, queue
+@dataclass
+class AudioStats:
+    played: int = 0
+    dropped: int = 0
+    stale: int = 0
+    interrupted: int = 0
+    failed: int = 0
+    late: int = 0
+
+
+@dataclass(order=True)
+class AudioTask:
+    # higher priorities play first, and equal priorities play in order
+    sort_key: tuple[int, int]
+    filename: str = field(compare=False)
+    priority: int = field(compare=False)
+    created: float = field(compare=False)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created
+
+
+class AudioQueue:
+    """Priority queue of clips to play, applying an `AudioQueuePolicy`."""
+
+    def __init__(self, policy: AudioQueuePolicy, stats: AudioStats):
+        super().__init__()
+        self.policy = policy
+        self.stats = stats
+        self.condition = Condition()
+        self.heap: list[AudioTask] = []
+        self.counter = itt.count()
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def put(self, filename: str, priority: int = 0) -> AudioTask:
+        task = AudioTask(
+            (-priority, next(self.counter)),
+            filename,
+            priority,
+            time.monotonic(),
+        )
+
+        with self.condition:
+            if self.policy.interrupt:
+                # older clips would only play after the one cutting them off
+                kept = [queued for queued in self.heap if queued.priority > priority]
+                if dropped := len(self.heap) - len(kept):
+                    self.heap = kept
+                    heapq.heapify(self.heap)
+                    self.stats.dropped += dropped
+                    logger.info('interrupting %d queued clips', dropped)
+
+            heapq.heappush(self.heap, task)
+
+            if 0 < self.policy.maxsize < len(self.heap):
+                dropped = min(self.heap, key=lambda task: (task.priority, task.created))
+                self.heap.remove(dropped)
+                heapq.heapify(self.heap)
+                self.stats.dropped += 1
+                logger.info('audio queue full, dropping `%s`', dropped.filename)
+
+            self.condition.notify()
+
+        return task
+
+    def get(self) -> AudioTask | None:
+        """Get the next clip to play, or None once the queue is closed."""
+        with self.condition:
+            while True:
+                while not self.heap and not self.closed:
+                    self.condition.wait()
+
+                if not self.heap:
+                    return None
+
+                task = heapq.heappop(self.heap)
+                max_age = self.policy.max_age
+                if max_age is not None and task.age > max_age:
+                    self.stats.stale += 1
+                    logger.info('skipping stale `%s`', task.filename)
+                    continue
+
+                return task
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class AudioEngine:
+    def __init__(
+        self,
+        cache: AudioCache | None = None,
+        policy: AudioQueuePolicy | None = None,
+    ):
+        super().__init__()
+        self.cache = AudioCache() if cache is None else cache
+        self.player = AudioPlayer()
+        self.stats = AudioStats()
+        self.current: AudioTask | None = None
 
-    if thread is None:
         logger.debug('creating audio queue')
-        queue = Queue()
+        policy = AudioQueuePolicy() if policy is None else policy
+        self.queue = AudioQueue(policy, self.stats)
 
         logger.debug('creating audio thread')
-        thread = Thread(target=play_audio_target, args=(queue,), daemon=True)
-        thread.start()
+        self.thread = Thread(target=self.play_audio_target, daemon=True)
+        self.thread.start()
+
+        metrics.gauge(
+            'watchfox_audio_queue_depth',
+            lambda: len(self.queue),
+            'Clips waiting to be played.',
+        )
+        for outcome in fields(AudioStats):
+            metrics.gauge(
+                'watchfox_audio_clips',
+                partial(getattr, self.stats, outcome.name),
+                'Clips by outcome (see `AudioStats`).',
+                outcome=outcome.name,
+            )
+        self.delay = metrics.histogram(
+            'watchfox_audio_delay_seconds',
+            'Time from queueing a clip to playing it.',
+        )
+
+    def play_audio_target(self):
+        while (task := self.queue.get()) is not None:
+            try:
+                clip = self.cache.get(task.filename)
+            except ValueError as error:
+                logger.error(error)
+                self.stats.failed += 1
+                continue
 
-    logger.info(f'sending `{filename}` to play queue')
-    queue.put_nowait(filename)
+            age = task.age
+            self.delay.observe(age)
+            if age > self.queue.policy.late_after:
+                self.stats.late += 1
+
+            logger.debug('playing %s', task.filename)
+            self.player.prepare()
+            self.current = task
+            match self.player.play(clip):
+                case 'played':
+                    self.stats.played += 1
+                case 'interrupted':
+                    self.stats.interrupted += 1
+                case 'failed':
+                    self.stats.failed += 1
+            self.current = None
+
+    def play(self, filename: str, priority: int = 0):
+        logger.info('sending `%s` to play queue', filename)
+        task = self.queue.put(filename, priority)
+
+        current = self.current
+        if (
+            self.queue.policy.interrupt
+            and current is not None
+            and current is not task
+            and current.priority <= priority
+        ):
+            logger.info('interrupting `%s`', current.filename)
+            self.player.stop()
+
+    def join(self):
+        self.queue.close()
+        self.thread.join()
+
+
+engine: AudioEngine | None = None
+engine_lock = Lock()
+
+
+def get_audio_engine() -> AudioEngine:
+    global engine
+
+    # receivers may run on multiple dispatch threads
+    with engine_lock:
+        if engine is None:
+            engine = AudioEngine()
+
+    return engine
+
+
+def preload_audio(filenames: Iterable[str]):
+    """Decode clips ahead of time, so that playing them has no decoding delay."""
+    get_audio_engine().cache.preload(filenames)
+
+
+def load_audio_bank(filename: str):
+    """Serve clips from an audio bank (see `watchfox.audiobank`)."""
+    from watchfox.audiobank import AudioBank
+
+    bank = AudioBank(filename)
+    logger.info(f'loaded audio bank `{filename}` with {len(bank)} clips')
+    get_audio_engine().cache.banks.append(bank)
+
+
+def configure_audio(policy: AudioQueuePolicy):
+    get_audio_engine().queue.policy = policy
+
+
+def get_audio_stats() -> AudioStats:
+    return get_audio_engine().stats
+
+
+def play_audio(filename: str, priority: int = 0):
+    get_audio_engine().play(filename, priority)
 
 
 def join_audio():
-    if thread is None:
-        return
+    global engine
+
+    with engine_lock:
+        if engine is None:
+            return
 
-    queue.put_nowait(None)
-    thread.join()
+        engine.join()
+        engine = None
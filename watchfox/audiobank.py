@@ -0,0 +1,83 @@
+"""Audio bank format, packing many decoded audio clips into a single file.
+
+An audio bank consists of a file magic, the size of the index, a JSON index
+mapping each clip name to the offset, size, sample rate, and channels of its
+PCM segment, and finally the PCM segments themselves.  Banks are memory-mapped
+when loaded, so that looking up a clip is a dictionary lookup and a slice.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Iterable
+
+from watchfox.audio import PCM_FORMAT, AudioClip, decode_audio
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'WATCHFOX-BANK\x01\n'
+INDEX_SIZE = struct.Struct('<I')
+
+
+def write_audio_bank(filename: str, clips: Iterable[tuple[str, AudioClip]]):
+    index: dict[str, list[int]] = {}
+    segments: list[bytes] = []
+    offset = 0
+
+    for name, clip in clips:
+        index[name] = [offset, clip.nbytes, clip.rate, clip.channels]
+        segments.append(bytes(clip.pcm))
+        offset += clip.nbytes
+
+    header = json.dumps({'format': PCM_FORMAT, 'clips': index}).encode()
+
+    tmp_filename = f'{filename}.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(INDEX_SIZE.pack(len(header)))
+        f.write(header)
+        f.writelines(segments)
+    os.replace(tmp_filename, filename)
+
+
+def build_audio_bank(filename: str, filenames: Iterable[str]):
+    """Decode audio files and pack them into a bank, keyed by their filenames."""
+    logger.info(f'building audio bank `{filename}`')
+    write_audio_bank(filename, ((name, decode_audio(name)) for name in filenames))
+
+
+class AudioBank:
+    def __init__(self, filename: str):
+        super().__init__()
+
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'`{filename}` is not a watchfox audio bank')
+
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        start = len(MAGIC)
+        [size] = INDEX_SIZE.unpack_from(self.buffer, start)
+        start += INDEX_SIZE.size
+        header = json.loads(self.buffer[start : start + size])
+
+        if header['format'] != PCM_FORMAT:
+            raise ValueError(f'unsupported audio bank format {header["format"]}')
+
+        self.index: dict[str, list[int]] = header['clips']
+        self.data_offset = start + size
+        self.view = memoryview(self.buffer)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+    def __getitem__(self, name: str) -> AudioClip:
+        offset, nbytes, rate, channels = self.index[name]
+        start = self.data_offset + offset
+        return AudioClip(self.view[start : start + nbytes], rate, channels)
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AudioJob:
+    text: str
+    filename: str
+    voice: str | None = None
+    settings: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def digest(self) -> str:
+        """Hash of everything which determines the generated audio."""
+        key = {'text': self.text, 'voice': self.voice, 'settings': self.settings}
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+type Synthesizer = Callable[[AudioJob, str], Awaitable[None]]
+
+
+async def edge_tts_synthesizer(job: AudioJob, filename: str):
+    import edge_tts
+
+    kwargs: dict[str, Any] = dict(job.settings)
+    if job.voice is not None:
+        kwargs['voice'] = job.voice
+
+    communicate = edge_tts.Communicate(job.text, **kwargs)
+    await communicate.save(filename)
+
+
+def load_manifest(filename: str) -> dict[str, str]:
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(filename: str, manifest: dict[str, str]):
+    tmp_filename = f'{filename}.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_filename, filename)
+
+
+async def generate_audio(
+    jobs: Iterable[AudioJob],
+    synthesize: Synthesizer = edge_tts_synthesizer,
+    *,
+    manifest_filename: str,
+    concurrency: int = 8,
+    force: bool = False,
+) -> tuple[int, int]:
+    """Generate audio files, skipping those which are already up to date.
+
+    The manifest keeps the digest of each generated file, so that files are
+    only regenerated when their text, voice, or settings change.  Files are
+    written atomically, and the manifest is saved even if generation fails
+    midway, so that interrupted runs can be resumed.
+
+    Returns the number of generated and skipped files.
+    """
+    if concurrency < 1:
+        raise ValueError(f'invalid {concurrency=}')
+
+    manifest = load_manifest(manifest_filename)
+    semaphore = asyncio.Semaphore(concurrency)
+    generated = skipped = 0
+
+    async def run(job: AudioJob):
+        nonlocal generated, skipped
+
+        digest = job.digest
+        if (
+            not force
+            and manifest.get(job.filename) == digest
+            and os.path.exists(job.filename)
+        ):
+            skipped += 1
+            return
+
+        async with semaphore:
+            logger.info('saving text=%r into filename=%r', job.text, job.filename)
+            tmp_filename = f'{job.filename}.tmp'
+            await synthesize(job, tmp_filename)
+            os.replace(tmp_filename, job.filename)
+
+        manifest[job.filename] = digest
+        generated += 1
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            for job in jobs:
+                os.makedirs(os.path.dirname(job.filename) or '.', exist_ok=True)
+                group.create_task(run(job))
+    finally:
+        save_manifest(manifest_filename, manifest)
+
+    return generated, skipped
@@ -1,18 +1,222 @@
 #!/usr/bin/env python
 import logging
-import logging.config
 import tomllib
+from typing import TYPE_CHECKING
 
 import click
 
-from watchfox.minifox import SSEProcessor, event_names
-from watchfox.obs import make_obs_manager
-from watchfox.sse import get_recorded_events, record_events, server_sent_events
-from watchfox.utils import sleep_iterator
+from watchfox.dispatch import backpressure_names
+from watchfox.types import event_names
+
+# subcommands import what they need when they run, so that e.g. `record` never
+# imports the OBS client, and `--mock-obs` never opens a websocket
+if TYPE_CHECKING:
+    from watchfox.dispatch import ShardedDispatcher
+    from watchfox.filters import FilterRules
+    from watchfox.obs import OBSManager
+    from watchfox.processes import ProcessPool
+    from watchfox.sse import ReconnectingEventSource
 
 logger = logging.getLogger(__name__)
 
 
+def dispatch_options(f):
+    f = click.option(
+        '--workers',
+        type=click.IntRange(min=0),
+        default=0,
+        help='Number of dispatch threads (0 dispatches inline).',
+    )(f)
+    f = click.option(
+        '--queue-size',
+        type=click.IntRange(min=0),
+        default=0,
+        help='Maximum queued events per dispatch thread (0 is unbounded).',
+    )(f)
+    f = click.option(
+        '--backpressure',
+        type=click.Choice(backpressure_names),
+        default='block',
+        help='What to do when a dispatch queue is full.',
+    )(f)
+    return f
+
+
+def processor_options(f):
+    f = click.option(
+        '--typed-events',
+        is_flag=True,
+        help='Decode event data into validated typed objects instead of dicts.',
+    )(f)
+    f = click.option(
+        '--track-state',
+        is_flag=True,
+        help='Track the state of each match, passed to receivers as `state`.',
+    )(f)
+    f = click.option(
+        '--processes',
+        type=click.IntRange(min=0),
+        default=0,
+        help='Number of worker processes for CPU-bound receivers (0 runs them '
+        'in-process).',
+    )(f)
+    return f
+
+
+def filter_options(f):
+    f = click.option(
+        '--whitelist',
+        type=click.Choice(event_names),
+        multiple=True,
+        help='Only process these events.',
+    )(f)
+    f = click.option(
+        '--blacklist',
+        type=click.Choice(event_names),
+        multiple=True,
+        help='Do not process these events.',
+    )(f)
+    f = click.option(
+        '--match',
+        'matches',
+        multiple=True,
+        help='Only process events of these matches.',
+    )(f)
+    f = click.option(
+        '--nick',
+        'nicks',
+        multiple=True,
+        help='Only process matches (starting from now) played by these players.',
+    )(f)
+    f = click.option(
+        '--start',
+        type=float,
+        help='Skip events before this many seconds after the first event.',
+    )(f)
+    f = click.option(
+        '--end',
+        type=float,
+        help='Skip events after this many seconds after the first event.',
+    )(f)
+    return f
+
+
+def make_filter_rules(config: dict, **options) -> 'FilterRules':
+    """Filter rules from the `[watchfox.filter]` config section, overridden by
+    the CLI options."""
+    from watchfox.filters import FilterRules
+
+    rules = FilterRules.from_config(config.get('watchfox', {}).get('filter', {}))
+    return rules.update(**options)
+
+
+def metrics_options(f):
+    f = click.option(
+        '--metrics-port',
+        type=click.IntRange(min=0, max=65535),
+        default=None,
+        help='Serve Prometheus metrics on this local port.',
+    )(f)
+    f = click.option(
+        '--metrics-interval',
+        type=click.FloatRange(min=0, min_open=True),
+        default=None,
+        help='Print a metrics summary every this many seconds.',
+    )(f)
+    return f
+
+
+def start_metrics(port: int | None, interval: float | None):
+    from watchfox.metrics import dump_metrics, serve_metrics
+
+    if port is not None:
+        server = serve_metrics(port)
+        print(f'serving metrics on http://localhost:{server.server_port}/metrics')
+    if interval is not None:
+        dump_metrics(interval)
+
+
+def make_pool(
+    manager: 'OBSManager',
+    config: dict | None,
+    processes: int,
+) -> 'ProcessPool | None':
+    if processes == 0:
+        return None
+
+    from watchfox.processes import ProcessPool
+
+    return ProcessPool(manager, config, processes)
+
+
+def make_manager(
+    mock_obs: bool,
+    obs_connections: int,
+    obs_cache: bool,
+) -> 'OBSManager':
+    if mock_obs:
+        from unittest.mock import MagicMock
+
+        # same as `make_obs_manager(mock=True)`, without importing the OBS client
+        return MagicMock()
+
+    from watchfox.obs import make_obs_manager
+
+    # connect in the background, while the event source connects
+    return make_obs_manager(pool_size=obs_connections, cache=obs_cache, lazy=True)
+
+
+def make_dispatcher(
+    workers: int,
+    queue_size: int,
+    backpressure: str,
+) -> 'ShardedDispatcher | None':
+    from watchfox.dispatch import ShardedDispatcher
+
+    if workers == 0:
+        return None
+
+    return ShardedDispatcher(
+        workers,
+        queue_size=queue_size,
+        backpressure=backpressure,  # type: ignore
+    )
+
+
+def make_sse_source(config: dict) -> 'ReconnectingEventSource':
+    from watchfox.sse import ReconnectingEventSource, ReconnectPolicy
+
+    minifox_config = config['minifoxwq']
+    policy = ReconnectPolicy.from_config(minifox_config.get('reconnect', {}))
+    return ReconnectingEventSource(minifox_config['sse_url'], policy)
+
+
+def make_sse_sources(
+    config: dict,
+    sources: tuple[str, ...] = (),
+) -> dict[str, 'ReconnectingEventSource']:
+    """Make the named minifox sources given as `NAME=URL` strings, falling back
+    to the `[minifoxwq.sources]` config section, or to the single `sse_url`."""
+    from watchfox.sse import ReconnectingEventSource, ReconnectPolicy
+
+    minifox_config = config['minifoxwq']
+    policy = ReconnectPolicy.from_config(minifox_config.get('reconnect', {}))
+
+    if sources:
+        urls = {}
+        for source in sources:
+            name, sep, url = source.partition('=')
+            if not sep:
+                raise click.BadParameter(f'expected NAME=URL, got {source!r}')
+            urls[name] = url
+    elif 'sources' in minifox_config:
+        urls = minifox_config['sources']
+    else:
+        urls = {'minifox': minifox_config['sse_url']}
+
+    return {name: ReconnectingEventSource(url, policy) for name, url in urls.items()}
+
+
 @click.group()
 @click.pass_context
 @click.option(
@@ -48,20 +252,29 @@ def cli(
         except FileNotFoundError:
             print(f'logging file `{log_config_filename}` not found.  skipping.')
         else:
+            import logging.config
+
+            from watchfox.logs import start_queue_listeners
+
             logging.config.dictConfig(logging_config)
+            start_queue_listeners()
 
 
 @cli.command('record')
 @click.pass_obj
-@click.argument('events-filename', default='events.pk')
+@click.argument('events-filename', default='events.rec')
 @click.option('--append', is_flag=True, help='Append server-sent events to file.')
 def cmd_record(config: dict, events_filename: str, append: bool):
     """Record events from minifox."""
+    from watchfox.sse import record_events
+
     print(f'command record {events_filename=}')
 
-    url = config['minifoxwq']['sse_url']
-    events = server_sent_events(url)
-    record_events(events_filename, append, events)
+    source = make_sse_source(config)
+    try:
+        record_events(events_filename, append, iter(source))
+    finally:
+        print(f'connection: {source.stats}')
 
 
 @cli.command('replay')
@@ -69,54 +282,226 @@ def cmd_record(config: dict, events_filename: str, append: bool):
 @click.argument(
     'events-filename',
     type=click.Path(exists=True, dir_okay=False),
-    default='events.pk',
+    default='events.rec',
 )
+@filter_options
+@click.option('--sleep', type=float, default=1.0, help='Seconds between events.')
 @click.option(
-    '--whitelist',
-    type=click.Choice(event_names),
-    multiple=True,
-    help='Only process these events.',
+    '--speed',
+    type=click.FloatRange(min=0.0, min_open=True),
+    help='Reproduce recorded timing at this speed (`inf` for no waiting);  '
+    'overrides --sleep.',
 )
+@click.option('--mock-obs', is_flag=True, help='Do not connect to OBS instance.')
 @click.option(
-    '--blacklist',
-    type=click.Choice(event_names),
-    multiple=True,
-    help='Do not process these events.',
+    '--obs-connections',
+    type=click.IntRange(min=1),
+    default=1,
+    help='Maximum number of concurrent OBS connections.',
 )
-@click.option('--sleep', type=float, default=1.0, help='Seconds between events.')
-@click.option('--mock-obs', is_flag=True, help='Do not connect to OBS instance.')
+@click.option(
+    '--obs-cache',
+    is_flag=True,
+    help='Skip OBS requests which would not change the OBS state.',
+)
+@dispatch_options
+@processor_options
+@metrics_options
 def cmd_replay(
     config: dict,
     events_filename: str,
-    whitelist: tuple[str],
-    blacklist: tuple[str],
+    whitelist: tuple[str, ...],
+    blacklist: tuple[str, ...],
+    matches: tuple[str, ...],
+    nicks: tuple[str, ...],
+    start: float | None,
+    end: float | None,
     sleep: float,
+    speed: float | None,
     mock_obs: bool,
+    obs_connections: int,
+    obs_cache: bool,
+    workers: int,
+    queue_size: int,
+    backpressure: str,
+    typed_events: bool,
+    track_state: bool,
+    processes: int,
+    metrics_port: int | None,
+    metrics_interval: float | None,
 ):
     """Process pre-recorded events."""
+    from watchfox.filters import FilterRules
+    from watchfox.minifox import SSEProcessor
+    from watchfox.recording import read_records
+    from watchfox.utils import LagStats, sleep_iterator, timed_iterator
+
     print(f'command replay {events_filename=}')
 
-    events = get_recorded_events(events_filename)
-    if whitelist:
-        events = (event for event in events if event.event in whitelist)
-    events = (event for event in events if event.event not in blacklist)
-    events = sleep_iterator(events, sleep)
+    rules = make_filter_rules(
+        config,
+        whitelist=whitelist,
+        blacklist=blacklist,
+        matches=matches,
+        nicks=nicks,
+        start=start,
+        end=end,
+    )
+    # the recording index takes care of the match and time rules;  the nick
+    # rules select matches from their `match_start`, and the name rules only
+    # decide which events reach the receivers, so both stay with the processor
+    processor_rules = FilterRules(rules.whitelist, rules.blacklist, nicks=rules.nicks)
+
+    start_metrics(metrics_port, metrics_interval)
+
+    manager = make_manager(mock_obs, obs_connections, obs_cache)
+    dispatcher = make_dispatcher(workers, queue_size, backpressure)
+    processor = SSEProcessor(
+        manager,
+        config.get('watchfox'),
+        dispatcher=dispatcher,
+        decoding='typed' if typed_events else 'dict',
+        track_state=track_state,
+        event_filter=processor_rules.compile() if processor_rules.enabled else None,
+        pool=make_pool(manager, config.get('watchfox'), processes),
+    )
+
+    # the index still skips events which are neither processed nor tracked
+    names = rules.names
+    if names is not None:
+        names = names | processor.tracked_names
+    events = read_records(
+        events_filename,
+        names=names,
+        match_ids=rules.matches,
+        start=rules.start,
+        end=rules.end,
+    )
+
+    stats = LagStats()
+    if speed is None:
+        events = sleep_iterator(events, sleep)
+    else:
+        events = timed_iterator(events, lambda event: event.timestamp, speed, stats)
 
-    manager = make_obs_manager(mock=mock_obs)
-    processor = SSEProcessor(manager, config.get('watchfox'))
     processor.process_events(events)
 
+    if speed is not None:
+        print(f'replay lag: {stats}')
+
 
 @cli.command('run')
 @click.pass_obj
 @click.option('--mock-obs', is_flag=True, help='Do no connect to OBS instance.')
-def cmd_run(config: dict, mock_obs: bool):
+@click.option(
+    '--obs-connections',
+    type=click.IntRange(min=1),
+    default=1,
+    help='Maximum number of concurrent OBS connections.',
+)
+@click.option(
+    '--obs-cache',
+    is_flag=True,
+    help='Skip OBS requests which would not change the OBS state.',
+)
+@click.option(
+    '--async',
+    'use_async',
+    is_flag=True,
+    help='Process events asynchronously, running matches concurrently.',
+)
+@click.option(
+    '--source',
+    'sources',
+    multiple=True,
+    metavar='NAME=URL',
+    help='Minifox SSE source (repeatable);  defaults to the config sources.',
+)
+@filter_options
+@dispatch_options
+@processor_options
+@metrics_options
+def cmd_run(
+    config: dict,
+    sources: tuple[str, ...],
+    whitelist: tuple[str, ...],
+    blacklist: tuple[str, ...],
+    matches: tuple[str, ...],
+    nicks: tuple[str, ...],
+    start: float | None,
+    end: float | None,
+    mock_obs: bool,
+    obs_connections: int,
+    obs_cache: bool,
+    use_async: bool,
+    workers: int,
+    queue_size: int,
+    backpressure: str,
+    typed_events: bool,
+    track_state: bool,
+    processes: int,
+    metrics_port: int | None,
+    metrics_interval: float | None,
+):
     """Process live events coming from minifox."""
+    import asyncio
+
+    from watchfox.flow import FlowConfig
+    from watchfox.minifox import SSEProcessor
+    from watchfox.sse import amerge_event_sources, merge_event_sources
+
     print('command run')
 
-    url = config['minifoxwq']['sse_url']
-    events = server_sent_events(url)
+    # async processing runs a task per match instead
+    if use_async and workers:
+        raise click.UsageError('--async cannot be combined with --workers')
+    flow = FlowConfig.from_config(config.get('watchfox', {}).get('flow', {}))
+    if use_async and flow.enabled:
+        raise click.UsageError('--async does not support [watchfox.flow]')
 
-    manager = make_obs_manager(mock=mock_obs)
-    processor = SSEProcessor(manager, config.get('watchfox'))
-    processor.process_events(events)
+    rules = make_filter_rules(
+        config,
+        whitelist=whitelist,
+        blacklist=blacklist,
+        matches=matches,
+        nicks=nicks,
+        start=start,
+        end=end,
+    )
+
+    start_metrics(metrics_port, metrics_interval)
+
+    manager = make_manager(mock_obs, obs_connections, obs_cache)
+    dispatcher = make_dispatcher(workers, queue_size, backpressure)
+    processor = SSEProcessor(
+        manager,
+        config.get('watchfox'),
+        dispatcher=dispatcher,
+        decoding='typed' if typed_events else 'dict',
+        track_state=track_state,
+        event_filter=rules.compile() if rules.enabled else None,
+        pool=make_pool(manager, config.get('watchfox'), processes),
+    )
+
+    # all sources share the processor, and thus the OBS connection pool
+    event_sources = make_sse_sources(config, sources)
+    try:
+        if len(event_sources) == 1:
+            [source] = event_sources.values()
+            if use_async:
+                asyncio.run(processor.aprocess_events(aiter(source)))
+            else:
+                processor.process_events(iter(source))
+        elif use_async:
+            async_events = amerge_event_sources(
+                {name: aiter(source) for name, source in event_sources.items()}
+            )
+            asyncio.run(processor.aprocess_events(async_events))
+        else:
+            events = merge_event_sources(
+                {name: iter(source) for name, source in event_sources.items()}
+            )
+            processor.process_events(events)
+    finally:
+        for name, source in event_sources.items():
+            print(f'connection {name}: {source.stats}')
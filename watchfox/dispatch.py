@@ -0,0 +1,131 @@
+import logging
+from functools import partial
+from queue import Empty, Full, Queue
+from threading import Thread
+from typing import Any, Callable, Literal, get_args
+
+from watchfox.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+type Backpressure = Literal['block', 'drop', 'drop-oldest']
+backpressure_names: list[str] = list(get_args(Backpressure.__value__))
+
+type dispatchtask = Callable[[], Any] | None
+
+
+class ShardedDispatcher:
+    """Runs tasks on a pool of worker threads, sharded by key.
+
+    Tasks submitted with the same key (e.g., the match id) always run on the
+    same worker, in submission order, while tasks with different keys may run
+    in parallel.  Each worker has its own bounded queue; when a queue is full,
+    the backpressure policy decides whether to block the caller, drop the new
+    task, or drop the oldest queued task.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        *,
+        queue_size: int = 0,
+        backpressure: Backpressure = 'block',
+        timeout: float | None = None,
+    ):
+        if workers < 1:
+            raise ValueError(f'invalid {workers=}')
+
+        if backpressure not in backpressure_names:
+            raise ValueError(f'invalid {backpressure=}')
+
+        super().__init__()
+        self.backpressure = backpressure
+        self.timeout = timeout
+        self.dropped = 0
+
+        self.queues: list[Queue[dispatchtask]] = [
+            Queue(maxsize=queue_size) for _ in range(workers)
+        ]
+        self.threads = [
+            Thread(target=self.worker_target, args=(queue,), daemon=True)
+            for queue in self.queues
+        ]
+        for thread in self.threads:
+            thread.start()
+
+        metrics.gauge(
+            'watchfox_dispatch_queue_depth',
+            lambda: sum(self.queue_depths),
+            'Tasks waiting in the dispatch queues.',
+        )
+        metrics.gauge(
+            'watchfox_dispatch_dropped',
+            lambda: self.dropped,
+            'Tasks dropped by the dispatch backpressure policy.',
+        )
+
+    @property
+    def queue_depths(self) -> list[int]:
+        return [queue.qsize() for queue in self.queues]
+
+    def shard(self, key: Any) -> Queue[dispatchtask]:
+        return self.queues[hash(key) % len(self.queues)]
+
+    def submit(self, key: Any, fn: Callable[..., Any], *args, **kwargs):
+        queue = self.shard(key)
+        task = partial(fn, *args, **kwargs)
+
+        match self.backpressure:
+            case 'block':
+                try:
+                    queue.put(task, timeout=self.timeout)
+                except Full:
+                    self.drop(key)
+
+            case 'drop':
+                try:
+                    queue.put_nowait(task)
+                except Full:
+                    self.drop(key)
+
+            case 'drop-oldest':
+                while True:
+                    try:
+                        queue.put_nowait(task)
+                    except Full:
+                        try:
+                            queue.get_nowait()
+                        except Empty:
+                            pass
+                        else:
+                            queue.task_done()
+                            self.drop(key)
+                    else:
+                        break
+
+    def drop(self, key: Any):
+        self.dropped += 1
+        logger.warning('dispatch queue full, dropping task key=%r', key)
+
+    def join(self):
+        """Wait for all submitted tasks to complete and stop the workers."""
+        for queue in self.queues:
+            queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+    @staticmethod
+    def worker_target(queue: Queue[dispatchtask]):
+        while True:
+            task = queue.get()
+            try:
+                if task is None:
+                    break
+
+                task()
+            except Exception as error:
+                logger.exception(error)
+            finally:
+                queue.task_done()
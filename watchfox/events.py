@@ -0,0 +1,260 @@
+"""Typed and validated minifox event data.
+
+These are slotted counterparts of the `TypedDict`s in `watchfox.types`;  they
+also support read-only dict-style access (e.g., `data['id']`), so that
+receivers written for the dict-based events keep working.
+"""
+
+import json
+import logging
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Literal, Self
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+loads: Callable[[str | bytes], Any] = json.loads if orjson is None else orjson.loads
+
+
+type DecodingMode = Literal['dict', 'typed']
+
+
+def check[T](data: dict[str, Any], key: str, types: type[T] | tuple[type, ...]) -> T:
+    try:
+        value = data[key]
+    except (KeyError, TypeError):
+        raise ValueError(f'missing field {key!r}') from None
+
+    # bool is a subclass of int, but never a valid number here
+    if not isinstance(value, types) or (isinstance(value, bool) and types is int):
+        raise ValueError(f'invalid field {key!r}: {value!r}')
+
+    return value  # type: ignore
+
+
+class EventData:
+    # set on events from one of several minifox sources, see `tag_source`
+    __slots__ = ('source',)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # the pickled state of slotted dataclasses only includes their fields
+        args = tuple(getattr(self, f.name) for f in fields(self))  # type: ignore
+        if (source := self.get('source')) is None:
+            return type(self), args
+        return make_tagged, (type(self), args, source)
+
+
+@dataclass(frozen=True, slots=True)
+class Player(EventData):
+    avatar: str
+    country: str
+    nick: str
+    rank: str
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'avatar', str),
+            check(data, 'country', str),
+            check(data, 'nick', str),
+            check(data, 'rank', str),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Settings(EventData):
+    board_size: int
+    chinese_rules: bool
+    handicap: int
+    komi: float
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'board_size', int),
+            check(data, 'chinese_rules', bool),
+            check(data, 'handicap', int),
+            check(data, 'komi', (int, float)),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class TimeControl(EventData):
+    byoyomi_periods: int
+    byoyomi_time: int
+    main_time: int
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'byoyomi_periods', int),
+            check(data, 'byoyomi_time', int),
+            check(data, 'main_time', int),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class MatchStart(EventData):
+    id: str
+    black: Player
+    white: Player
+    settings: Settings
+    time_control: TimeControl
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'id', str),
+            Player.decode(check(data, 'black', dict)),
+            Player.decode(check(data, 'white', dict)),
+            Settings.decode(check(data, 'settings', dict)),
+            TimeControl.decode(check(data, 'time_control', dict)),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class MatchMove(EventData):
+    id: str
+    move: tuple[int, int]
+    move_number: int
+    turn: Literal['B', 'W']
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        move = check(data, 'move', list)
+        if len(move) != 2 or not all(type(x) is int for x in move):
+            raise ValueError(f'invalid field move: {move!r}')
+
+        turn = check(data, 'turn', str)
+        if turn not in ('B', 'W'):
+            raise ValueError(f'invalid field turn: {turn!r}')
+
+        return cls(
+            check(data, 'id', str),
+            (move[0], move[1]),
+            check(data, 'move_number', int),
+            turn,  # type: ignore
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Time(EventData):
+    byoyomi: int
+    byoyomi_time: int
+    connected: bool
+    disconnected_time: int
+    main_time: int
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'byoyomi', int),
+            check(data, 'byoyomi_time', int),
+            check(data, 'connected', bool),
+            check(data, 'disconnected_time', int),
+            check(data, 'main_time', int),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class MatchTime(EventData):
+    id: str
+    black_time: Time
+    white_time: Time
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'id', str),
+            Time.decode(check(data, 'black_time', dict)),
+            Time.decode(check(data, 'white_time', dict)),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class MatchChat(EventData):
+    id: str
+    country: str
+    nick: str
+    rank: str
+    message: str
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(
+            check(data, 'id', str),
+            check(data, 'country', str),
+            check(data, 'nick', str),
+            check(data, 'rank', str),
+            check(data, 'message', str),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class MatchEnd(EventData):
+    id: str
+    result: str
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> Self:
+        return cls(check(data, 'id', str), check(data, 'result', str))
+
+
+decoders: dict[str, Callable[[dict[str, Any]], EventData]] = {
+    'match_start': MatchStart.decode,
+    'match_time': MatchTime.decode,
+    'match_move': MatchMove.decode,
+    'match_chat': MatchChat.decode,
+    'match_end': MatchEnd.decode,
+}
+
+
+def decode_event_data(name: str, data: str, mode: DecodingMode = 'dict') -> Any:
+    """Decode the JSON data of an event, either into a dict (converting the
+    `match_move` move into a tuple), or into the corresponding typed object."""
+    obj = loads(data)
+
+    if mode == 'typed':
+        try:
+            decoder = decoders[name]
+        except KeyError:
+            return obj
+
+        return decoder(obj)
+
+    if name == 'match_move':
+        # convert json list into tuple
+        obj['move'] = tuple(obj['move'])
+
+    return obj
+
+
+def tag_source(data: Any, source: str):
+    """Tag decoded event data with the name of the minifox source it came from,
+    available as `data['source']` (and `data.source` for typed events)."""
+    if isinstance(data, EventData):
+        # typed events are frozen, but `source` is not one of their fields
+        object.__setattr__(data, 'source', source)
+    else:
+        data['source'] = source
+
+
+def make_tagged(cls: type[EventData], args: tuple[Any, ...], source: str) -> EventData:
+    """Unpickle tagged typed event data."""
+    data = cls(*args)
+    tag_source(data, source)
+    return data
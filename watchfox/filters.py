@@ -0,0 +1,168 @@
+"""Event filters, evaluated on the raw event before its data is decoded.
+
+Filter rules come from the `[watchfox.filter]` config section and from the CLI,
+and are compiled into a single `EventPredicate` which only looks at the event
+name, the match id and player nicks (extracted from the raw JSON with regular
+expressions), and the event timestamp.
+"""
+
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Any, Collection, Final, Self
+
+from watchfox.types import event_names
+
+logger = logging.getLogger(__name__)
+
+
+# the first `"id"` key of the event data is the match id (no nested object of
+# any minifox event has an `id`, and quotes within strings are escaped)
+match_id_pattern: Final = re.compile(r'(?<!\\)"id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+nick_pattern: Final = re.compile(r'(?<!\\)"nick"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def get_raw_match_id(data: str) -> str | None:
+    if (match := match_id_pattern.search(data)) is None:
+        return None
+
+    return json.loads(f'"{match[1]}"') if '\\' in match[1] else match[1]
+
+
+def get_raw_nicks(data: str) -> list[str]:
+    return [
+        json.loads(f'"{nick}"') if '\\' in nick else nick
+        for nick in nick_pattern.findall(data)
+    ]
+
+
+def optional_set(values: Collection[str] | None) -> frozenset[str] | None:
+    return None if not values else frozenset(values)
+
+
+@dataclass(frozen=True)
+class FilterRules:
+    """Event filter rules.
+
+    - `whitelist`, `blacklist`:  event names to process, and not to process;
+      the events which update the tracked state (e.g., `match_start`) are
+      still tracked, but not passed to the receivers.
+    - `matches`:  ids of the matches to process.
+    - `nicks`:  only process matches played by one of these players;  matches
+      are selected at `match_start`, so matches which started before watchfox
+      are not processed.
+    - `start`, `end`:  time window, in seconds after the first event.
+    """
+
+    whitelist: frozenset[str] | None = None
+    blacklist: frozenset[str] = frozenset()
+    matches: frozenset[str] | None = None
+    nicks: frozenset[str] | None = None
+    start: float | None = None
+    end: float | None = None
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> Self:
+        return cls(
+            optional_set(config.get('whitelist')),
+            frozenset(config.get('blacklist', [])),
+            optional_set(config.get('matches')),
+            optional_set(config.get('nicks')),
+            config.get('start'),
+            config.get('end'),
+        )
+
+    def update(self, **rules: Any) -> Self:
+        """Override rules with those which are set (e.g., CLI options)."""
+        overrides = {
+            field.name: value
+            for field in fields(self)
+            if (value := rules.get(field.name)) is not None and value != ()
+        }
+        for name in ['whitelist', 'blacklist', 'matches', 'nicks']:
+            if name in overrides:
+                overrides[name] = frozenset(overrides[name])
+
+        return replace(self, **overrides)
+
+    @property
+    def names(self) -> frozenset[str] | None:
+        """Event names to process, or None for all of them."""
+        if self.whitelist is None and not self.blacklist:
+            return None
+
+        whitelist = event_names if self.whitelist is None else self.whitelist
+        return frozenset(whitelist).difference(self.blacklist)
+
+    @property
+    def enabled(self) -> bool:
+        return self != FilterRules()
+
+    def compile(self) -> 'EventPredicate':
+        return EventPredicate(self)
+
+
+class EventPredicate:
+    """Predicate over the event name, raw data, and timestamp, which selects
+    the matches and the time window to process;  the name rules are left to
+    `delivers`, as the events they exclude may still need to be tracked.
+
+    The predicate is stateful:  it remembers the matches selected by the nick
+    rules, and the timestamp of the first event (for the time window).
+    """
+
+    def __init__(self, rules: FilterRules):
+        super().__init__()
+        self.names = rules.names
+        self.matches = rules.matches
+        self.nicks = rules.nicks
+        self.start = rules.start
+        self.end = rules.end
+
+        self.timed = rules.start is not None or rules.end is not None
+        self.t0: float | None = None
+        # matches selected by the nick rules
+        self.selected: set[str] = set()
+
+    def __call__(self, name: str, data: str, timestamp: float | None = None) -> bool:
+        if self.timed and not self.in_window(timestamp):
+            return False
+
+        if self.matches is None and self.nicks is None:
+            return True
+
+        id = get_raw_match_id(data)
+        if self.matches is not None and id not in self.matches:
+            return False
+
+        if self.nicks is not None and id is not None:
+            if name == 'match_start' and not self.nicks.isdisjoint(get_raw_nicks(data)):
+                logger.info('selecting match id=%r', id)
+                self.selected.add(id)
+
+            if id not in self.selected:
+                return False
+
+            if name == 'match_end':
+                self.selected.discard(id)
+
+        return True
+
+    def delivers(self, name: str) -> bool:
+        """Whether the events named `name` are passed to the receivers."""
+        return self.names is None or name in self.names
+
+    def in_window(self, timestamp: float | None) -> bool:
+        if timestamp is None:
+            timestamp = time.time()
+        if self.t0 is None:
+            self.t0 = timestamp
+
+        elapsed = timestamp - self.t0
+        if self.start is not None and elapsed < self.start:
+            return False
+        if self.end is not None and elapsed > self.end:
+            return False
+        return True
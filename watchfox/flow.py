@@ -0,0 +1,176 @@
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Condition
+from typing import Any, Self
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FlowConfig:
+    """Flow control settings, read from the `[watchfox.flow]` config section.
+
+    - `coalesce`:  events for which only the latest pending one per match is
+      kept when the processor falls behind.
+    - `max_rate`:  maximum events per second per match;  events arriving too
+      early are held back, and only the latest held back event is processed.
+    - `debounce`:  seconds without new events (per match) before processing
+      the latest event.
+    """
+
+    coalesce: frozenset[str] = frozenset()
+    max_rate: dict[str, float] = field(default_factory=dict)
+    debounce: dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> Self:
+        return cls(
+            frozenset(config.get('coalesce', [])),
+            event_values(config, 'max_rate', positive=True),
+            event_values(config, 'debounce', positive=False),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.coalesce or self.max_rate or self.debounce)
+
+
+def event_values(config: dict[str, Any], key: str, positive: bool) -> dict[str, float]:
+    """Per-event values of a config table, which must be positive (or, if not
+    `positive`, non-negative) numbers."""
+    values = dict(config.get(key, {}))
+    for name, value in values.items():
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, int | float)
+            or not (value > 0 if positive else value >= 0)
+        ):
+            raise ValueError(f'invalid flow setting {key}.{name}={value!r}')
+
+    return values
+
+
+class EventBuffer:
+    """Thread-safe buffer between the event reader and the event processor.
+
+    Events are generally processed in order;  rate-limited and debounced events
+    are held back until they are due, at which point they are processed ahead
+    of any later events.  A coalesced event moves to the position of the
+    latest event it replaces.  Held back events of a match are released ahead
+    of its `match_end`, and all of them are released in arrival order once the
+    buffer is closed.
+    """
+
+    def __init__(self, flow: FlowConfig):
+        super().__init__()
+        self.flow = flow
+        self.condition = Condition()
+        self.closed = False
+        self.coalesced = 0
+        self.arrivals = itertools.count()
+
+        # ready events, as mutable [arrival, name, data] slots;  the name of
+        # coalesced slots is set to None, and they are skipped
+        self.ready: deque[list[Any]] = deque()
+        # ready slots which may still be coalesced
+        self.pending: dict[tuple[str, Any], list[Any]] = {}
+        # held back events, as mutable [due, arrival, name, data] slots
+        self.delayed: dict[tuple[str, Any], list[Any]] = {}
+        # release time of the last rate-limited events
+        self.released: dict[tuple[str, Any], float] = {}
+
+    def put(self, name: str, data: Any):
+        id = data['id']
+        key = (name, id)
+        now = time.monotonic()
+        arrival = next(self.arrivals)
+
+        with self.condition:
+            if name == 'match_end':
+                self.release_match(id)
+
+            if name in self.flow.debounce:
+                if key in self.delayed:
+                    self.coalesced += 1
+                due = now + self.flow.debounce[name]
+                self.delayed[key] = [due, arrival, name, data]
+
+            elif name in self.flow.max_rate:
+                interval = 1 / self.flow.max_rate[name]
+                due = self.released.get(key, -float('inf')) + interval
+                if key in self.delayed:
+                    self.delayed[key][1:] = [arrival, name, data]
+                    self.coalesced += 1
+                elif due > now:
+                    self.delayed[key] = [due, arrival, name, data]
+                else:
+                    self.released[key] = now
+                    self.ready.append([arrival, name, data])
+
+            else:
+                slot = [arrival, name, data]
+                if name in self.flow.coalesce:
+                    if (previous := self.pending.get(key)) is not None:
+                        previous[1] = None
+                        self.coalesced += 1
+                    self.pending[key] = slot
+                self.ready.append(slot)
+
+            self.condition.notify()
+
+    def release_match(self, id: Any):
+        """Release the held back events of an ending match."""
+        delayed = sorted(
+            (slot for key, slot in self.delayed.items() if key[1] == id),
+            key=lambda slot: slot[1],
+        )
+        for _, arrival, name, data in delayed:
+            del self.delayed[(name, id)]
+            self.ready.append([arrival, name, data])
+
+        for stale in [key for key in self.released if key[1] == id]:
+            del self.released[stale]
+
+    def get(self) -> tuple[str, Any] | None:
+        """Get the next event, or None once the buffer is closed and empty."""
+        with self.condition:
+            while True:
+                timeout = None
+                if self.delayed:
+                    key = min(self.delayed, key=lambda key: self.delayed[key][0])
+                    due, _, name, data = self.delayed[key]
+                    now = time.monotonic()
+                    if due <= now:
+                        del self.delayed[key]
+                        if name in self.flow.max_rate:
+                            self.released[key] = now
+                        return name, data
+
+                    timeout = due - now
+
+                while self.ready:
+                    _, name, data = slot = self.ready.popleft()
+                    if name is None:
+                        continue
+
+                    key = (name, data['id'])
+                    if self.pending.get(key) is slot:
+                        del self.pending[key]
+                    return name, data
+
+                if self.closed:
+                    return None
+
+                self.condition.wait(timeout)
+
+    def close(self):
+        """Stop accepting events, and release the held back ones."""
+        with self.condition:
+            self.closed = True
+            released = [slot[1:] for slot in self.delayed.values()]
+            self.delayed.clear()
+            self.ready = deque(sorted([*self.ready, *released], key=lambda s: s[0]))
+            self.condition.notify()
@@ -0,0 +1,129 @@
+"""Logging helpers which keep log output off the event hot path.
+
+- `DeferredQueueHandler` hands log records to a background `QueueListener`,
+  which formats them and writes them to the actual handlers.
+- `JSONFormatter` writes one JSON object per record, for structured logs.
+- `EventSampler` decides which events get a structured per-event log record.
+
+See `logging.toml` for a configuration using all of them.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+from dataclasses import dataclass, field
+from typing import Any, Self
+
+logger = logging.getLogger(__name__)
+
+# structured per-event records, see `EventSampler`
+event_logger = logging.getLogger('watchfox.events')
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler which leaves all formatting to the listener thread.
+
+    The standard `QueueHandler` formats each record before enqueueing it (so
+    that records can be pickled);  within a single process this is not needed,
+    and the emitting thread then only pays for creating the record.  Log
+    arguments should therefore not be mutated after logging them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_queue_listeners() -> list[logging.handlers.QueueListener]:
+    """Start the listeners of the queue handlers created by `dictConfig`, and
+    stop them (flushing any queued records) at exit."""
+    listeners = []
+    for name in logging.getHandlerNames():
+        handler = logging.getHandlerByName(name)
+        listener = getattr(handler, 'listener', None)
+        if isinstance(listener, logging.handlers.QueueListener):
+            listener.start()
+            atexit.register(listener.stop)
+            listeners.append(listener)
+
+    return listeners
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats each record as a JSON object, including the `fields` extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        obj: dict[str, Any] = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        obj.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            obj['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(obj, default=str)
+
+
+@dataclass
+class EventSampler:
+    """Samples events for structured logging, read from the
+    `[watchfox.event_log]` config section.
+
+    - `sample`:  fraction of events logged, either for all events, or per
+      event name (e.g., `{ match_move = 1.0, match_time = 0.01 }`).
+
+    Sampling is deterministic (every n-th event of each name), so that it costs
+    a counter increment per event;  with several dispatch threads the counts
+    are not locked, so sampling is only approximate.
+    """
+
+    periods: dict[str, int] = field(default_factory=dict)
+    default_period: int = 0
+    counts: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> Self:
+        sample = config.get('sample', 0.0)
+        if isinstance(sample, dict):
+            periods = {name: rate_to_period(rate) for name, rate in sample.items()}
+            return cls(periods)
+
+        return cls(default_period=rate_to_period(sample))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.default_period or any(self.periods.values()))
+
+    def sample(self, name: str) -> bool:
+        period = self.periods.get(name, self.default_period)
+        if not period:
+            return False
+
+        count = self.counts.get(name, 0)
+        self.counts[name] = count + 1
+        return count % period == 0
+
+
+def rate_to_period(rate: float) -> int:
+    if not 0 <= rate <= 1:
+        raise ValueError(f'invalid sampling {rate=}')
+
+    return round(1 / rate) if rate else 0
+
+
+def log_event(name: str, data: Any, duration: float):
+    """Write a structured record for a processed event."""
+    event_logger.info(
+        'processed %s',
+        name,
+        extra={
+            'fields': {
+                'event': name,
+                'id': data.get('id'),
+                'source': data.get('source'),
+                'duration_ms': round(duration * 1000, 3),
+            }
+        },
+    )
@@ -0,0 +1,323 @@
+"""Lightweight in-process metrics.
+
+Counters, gauges, and latency histograms are kept in a `Metrics` registry, and
+can be exported in the Prometheus text format, either from a local HTTP
+endpoint (see `serve_metrics`), or as a periodic human-readable summary (see
+`dump_metrics`).  Updating a metric is a dictionary lookup and a few additions
+under a lock, so that instrumentation can stay enabled in production.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Iterator, Literal, cast
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+type MetricKind = Literal['counter', 'gauge', 'histogram']
+type Labels = tuple[tuple[str, str], ...]
+
+# seconds, from sub-millisecond handlers to stalled OBS requests
+default_buckets: tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Counter:
+    __slots__ = ('lock', 'value')
+
+    def __init__(self):
+        super().__init__()
+        self.lock = Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    """Gauge whose value is read from a callback when collected."""
+
+    __slots__ = ('fn',)
+
+    def __init__(self, fn: Callable[[], float]):
+        super().__init__()
+        self.fn = fn
+
+    @property
+    def value(self) -> float:
+        return self.fn()
+
+
+class Histogram:
+    __slots__ = ('lock', 'buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets: tuple[float, ...] = default_buckets):
+        super().__init__()
+        self.lock = Lock()
+        self.buckets = buckets
+        # the last count is for values above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self) -> 'Timer':
+        return Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket containing it."""
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class Timer:
+    """Context manager observing the elapsed time into a histogram."""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        super().__init__()
+        self.histogram = histogram
+
+    def __enter__(self) -> 'Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+type Metric = Counter | Gauge | Histogram
+
+
+@dataclass
+class Family:
+    kind: MetricKind
+    help: str
+    series: dict[Labels, Metric] = field(default_factory=dict)
+
+
+class Metrics:
+    def __init__(self):
+        super().__init__()
+        self.lock = Lock()
+        self.families: dict[str, Family] = {}
+
+    def get_or_create(
+        self,
+        kind: MetricKind,
+        name: str,
+        help: str,
+        labels: dict[str, str],
+        factory: Callable[[], Metric],
+    ) -> Metric:
+        key = tuple(sorted(labels.items()))
+        try:
+            return self.families[name].series[key]
+        except KeyError:
+            pass
+
+        with self.lock:
+            family = self.families.setdefault(name, Family(kind, help))
+            if family.kind != kind:
+                raise ValueError(f'metric {name} is a {family.kind}, not a {kind}')
+
+            if key not in family.series:
+                family.series[key] = factory()
+            return family.series[key]
+
+    def counter(self, name: str, help: str = '', **labels: str) -> Counter:
+        metric = self.get_or_create('counter', name, help, labels, Counter)
+        return cast(Counter, metric)
+
+    def histogram(self, name: str, help: str = '', **labels: str) -> Histogram:
+        metric = self.get_or_create('histogram', name, help, labels, Histogram)
+        return cast(Histogram, metric)
+
+    def gauge(
+        self,
+        name: str,
+        fn: Callable[[], float],
+        help: str = '',
+        **labels: str,
+    ) -> Gauge:
+        """Register a gauge, replacing any gauge with the same labels."""
+        metric = self.get_or_create('gauge', name, help, labels, lambda: Gauge(fn))
+        gauge = cast(Gauge, metric)
+        gauge.fn = fn
+        return gauge
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        return ''.join(f'{line}\n' for line in self.render_lines())
+
+    def render_lines(self) -> Iterator[str]:
+        with self.lock:
+            families = [
+                (name, family, list(family.series.items()))
+                for name, family in sorted(self.families.items())
+            ]
+
+        for name, family, series in families:
+            if family.help:
+                yield f'# HELP {name} {family.help}'
+            yield f'# TYPE {name} {family.kind}'
+
+            for labels, metric in series:
+                if isinstance(metric, Histogram):
+                    total = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        total += count
+                        le = (*labels, ('le', repr(bound)))
+                        yield f'{name}_bucket{format_labels(le)} {total}'
+                    le = (*labels, ('le', '+Inf'))
+                    yield f'{name}_bucket{format_labels(le)} {metric.count}'
+                    yield f'{name}_sum{format_labels(labels)} {metric.sum}'
+                    yield f'{name}_count{format_labels(labels)} {metric.count}'
+                else:
+                    try:
+                        value = metric.value
+                    except Exception as error:
+                        logger.warning(f'failed to collect {name}: {error!r}')
+                        continue
+                    yield f'{name}{format_labels(labels)} {value}'
+
+    def counters(self) -> dict[tuple[str, Labels], float]:
+        with self.lock:
+            return {
+                (name, labels): metric.value
+                for name, family in self.families.items()
+                for labels, metric in family.series.items()
+                if isinstance(metric, Counter)
+            }
+
+    def summary(
+        self,
+        previous: dict[tuple[str, Labels], float] | None = None,
+        elapsed: float = 0.0,
+    ) -> Iterator[str]:
+        """Human-readable summary lines, with histogram quantiles, and counter
+        rates since the `previous` counter values (taken `elapsed` seconds ago)."""
+        with self.lock:
+            families = [
+                (name, list(family.series.items()))
+                for name, family in sorted(self.families.items())
+            ]
+
+        for name, series in families:
+            for labels, metric in series:
+                line = f'{name}{format_labels(labels)}'
+                if isinstance(metric, Histogram):
+                    if metric.count:
+                        yield (
+                            f'{line} count={metric.count} '
+                            f'mean={metric.mean * 1000:.2f}ms '
+                            f'p50<={metric.quantile(0.5) * 1000:g}ms '
+                            f'p99<={metric.quantile(0.99) * 1000:g}ms'
+                        )
+                elif isinstance(metric, Counter) and previous is not None and elapsed:
+                    rate = (metric.value - previous.get((name, labels), 0)) / elapsed
+                    yield f'{line} {metric.value:g} ({rate:.1f}/s)'
+                else:
+                    yield f'{line} {metric.value:g}'
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+
+# default registry, used by the watchfox instrumentation
+metrics = Metrics()
+
+
+def serve_metrics(
+    port: int,
+    host: str = 'localhost',
+    registry: Metrics = metrics,
+) -> 'ThreadingHTTPServer':
+    """Serve the metrics in the Prometheus text format on a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f'serving metrics on http://{host}:{server.server_port}/metrics')
+    return server
+
+
+def dump_metrics(
+    interval: float,
+    registry: Metrics = metrics,
+    write: Callable[[str], object] = print,
+) -> threading.Thread:
+    """Write a summary of the metrics every `interval` seconds on a daemon
+    thread."""
+
+    def dump_target():
+        previous = registry.counters()
+        while True:
+            time.sleep(interval)
+            for line in registry.summary(previous, interval):
+                write(line)
+            previous = registry.counters()
+
+    thread = threading.Thread(target=dump_target, daemon=True)
+    thread.start()
+    return thread
@@ -1,21 +1,87 @@
+import asyncio
+import inspect
 import logging
-from typing import Any, Iterator
+import time
+from collections import defaultdict
+from functools import cache
+from threading import Thread
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Iterator
+from weakref import WeakKeyDictionary
 
 from blinker import Signal
-from httpx_sse import ServerSentEvent
 
-from watchfox.obs import OBSManager
+from watchfox.dispatch import ShardedDispatcher
+from watchfox.events import DecodingMode, decode_event_data, tag_source
+from watchfox.filters import EventPredicate
+from watchfox.flow import EventBuffer, FlowConfig
+from watchfox.logs import EventSampler, log_event
+from watchfox.metrics import Histogram, metrics
+from watchfox.state import MatchStore, PlayerIndex
+from watchfox.types import Color, event_names
+
+if TYPE_CHECKING:
+    from httpx_sse import ServerSentEvent
+
+    from watchfox.obs import OBSManager
+    from watchfox.processes import ProcessPool
 
 logger = logging.getLogger(__name__)
 
 
-event_names = [
-    'match_start',
-    'match_time',
-    'match_move',
-    'match_chat',
-    'match_end',
-]
+def receiver_name(receiver: Callable[..., Any]) -> str:
+    module = getattr(receiver, '__module__', None)
+    name = getattr(receiver, '__qualname__', None) or repr(receiver)
+    return name if module is None else f'{module}.{name}'
+
+
+@cache
+def signal_histogram(name: str) -> Histogram:
+    return metrics.histogram(
+        'watchfox_signal_seconds',
+        'Time spent running all receivers of a signal.',
+        signal=name,
+    )
+
+
+# histograms of each signal's receivers, which are weakly referenced (as by the
+# signals themselves), so that caching does not keep receivers connected
+receiver_histograms: defaultdict[
+    str, WeakKeyDictionary[Callable[..., Any], Histogram]
+] = defaultdict(WeakKeyDictionary)
+
+
+def receiver_histogram(name: str, receiver: Callable[..., Any]) -> Histogram:
+    histograms = receiver_histograms[name]
+    try:
+        return histograms[receiver]
+    except (KeyError, TypeError):
+        pass
+
+    histogram = metrics.histogram(
+        'watchfox_receiver_seconds',
+        'Time spent in each signal receiver.',
+        signal=name,
+        receiver=receiver_name(receiver),
+    )
+    try:
+        histograms[receiver] = histogram
+    except TypeError:
+        # receivers which cannot be weakly referenced are not cached
+        pass
+    return histogram
+
+
+def event_id(data: Any) -> Any:
+    """Match id of the event data, or None for malformed events."""
+    try:
+        return data['id']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+async def timed(awaitable: Awaitable[Any], histogram: Histogram):
+    with histogram.time():
+        await awaitable
 
 
 class SSEProcessor:
@@ -33,27 +99,352 @@ class SSEProcessor:
         'match_end': match_end,
     }
 
-    def __init__(self, manager: OBSManager, config: dict[str, Any] | None = None):
+    def __init__(
+        self,
+        manager: 'OBSManager',
+        config: dict[str, Any] | None = None,
+        *,
+        dispatcher: ShardedDispatcher | None = None,
+        decoding: DecodingMode = 'dict',
+        track_state: bool = False,
+        event_filter: EventPredicate | None = None,
+        pool: 'ProcessPool | None' = None,
+    ):
         super().__init__()
         self.manager = manager
         self.config = {} if config is None else config
+        self.dispatcher = dispatcher
+        self.decoding = decoding
+        self.flow = FlowConfig.from_config(self.config.get('flow', {}))
+        # when tracking state, receivers also get the match state as `state`
+        self.matches = MatchStore() if track_state else None
+        # player index of each ongoing match, built at `match_start`
+        self.players: dict[str, PlayerIndex] = {}
+        self.event_sampler = EventSampler.from_config(self.config.get('event_log', {}))
+        # see `watchfox.filters`
+        self.event_filter = event_filter
+        # runs the `cpu_bound` receivers, see `watchfox.processes`
+        self.pool = pool
+        # events which are processed even without receivers
+        self.tracked_names = set(event_names if track_state else [])
+        self.tracked_names.update(['match_start', 'match_end'])
 
-    def process_events(self, events: Iterator[ServerSentEvent]):
-        for event in events:
-            logger.info(f'processing SSE {event.event}')
-            self.process_event(event)
+    def process_events(self, events: Iterator['ServerSentEvent']):
+        if self.flow.enabled:
+            self.process_buffered_events(events)
+        else:
+            for event in events:
+                logger.info('processing SSE %s', event.event)
+                self.process_event(event)
 
-    def process_event(self, event: ServerSentEvent):
-        name = event.event
-        data = event.json()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+        if self.pool is not None:
+            self.pool.join()
+
+    def process_buffered_events(self, events: Iterator['ServerSentEvent']):
+        """Read events on a separate thread, so that flow control (coalescing,
+        rate limiting, debouncing) can act on the events which queue up while
+        the processor is busy."""
+        buffer = EventBuffer(self.flow)
+        # errors of the reader thread, raised once the buffer is drained
+        errors: list[Exception] = []
+
+        def reader_target():
+            try:
+                for event in events:
+                    item = self.decode_event(event)
+                    if item is not None and self.valid(*item):
+                        buffer.put(*item)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                buffer.close()
+
+        reader = Thread(target=reader_target, daemon=True)
+        reader.start()
+
+        while (item := buffer.get()) is not None:
+            name, data = item
+            logger.info('processing SSE %s', name)
+            self.dispatch(name, data)
+
+        reader.join()
+        logger.info('coalesced %d events', buffer.coalesced)
+        if errors:
+            raise errors[0]
+
+    def process_event(self, event: 'ServerSentEvent'):
+        if (item := self.decode_event(event)) is not None:
+            self.dispatch(*item)
+
+    def dispatch(self, name: str, data: Any):
+        id = event_id(data)
+        if self.dispatcher is None or id is None:
+            self.handle(name, data)
+        else:
+            # sharding by match keeps the events of each match in order
+            self.dispatcher.submit(id, self.handle, name, data)
+
+    def valid(self, name: str, data: Any) -> bool:
+        """Whether an event can be handled, logging the invalid ones."""
+        if name not in self.signals:
+            logger.error('invalid event name=%r', name)
+        elif event_id(data) is None:
+            logger.error('invalid %s event without id', name)
+        else:
+            return True
+
+        return False
+
+    def handle(self, name: str, data: Any):
+        if not self.valid(name, data):
+            return
+
+        sampled = self.event_sampler.sample(name)
+        start = time.perf_counter()
+
+        kwargs = self.track(name, data)
+        try:
+            if self.delivers(name):
+                self.send(name, data, **kwargs)
+        finally:
+            # ended matches are evicted even if a receiver fails
+            self.untrack(name, data)
+
+        if sampled:
+            log_event(name, data, time.perf_counter() - start)
+
+    def track(self, name: str, data: Any) -> dict[str, Any]:
+        """Update the match state, and return the extra receiver arguments."""
+        if name == 'match_start':
+            id = data['id']
+            try:
+                self.players[id] = PlayerIndex.from_match_start(data)
+            except (KeyError, TypeError) as error:
+                # the match is processed without a player index
+                logger.error('invalid match_start players id=%r: %r', id, error)
+                self.players.pop(id, None)
+
+        if self.matches is None:
+            return {}
+
+        state = self.matches.update(name, data)
+        if self.pool is not None:
+            # the workers keep their own copy of the state
+            self.pool.track(name, data)
+        return {'state': state}
+
+    def untrack(self, name: str, data: Any):
+        if name != 'match_end':
+            return
+
+        self.players.pop(data['id'], None)
+        if self.matches is not None:
+            self.matches.evict(data['id'])
+            if self.pool is not None:
+                self.pool.untrack(data['id'])
+
+    def nick_color(self, id: str, nick: str) -> Color | None:
+        """Color played by `nick` in match `id`, or None if `nick` is not playing
+        (or the match started before watchfox did)."""
+        try:
+            return self.players[id].color(nick)
+        except KeyError:
+            return None
+
+    def send(self, name: str, data: Any, **kwargs):
+        try:
+            signal = self.signals[name]
+        except KeyError:
+            logger.error('invalid event name=%r', name)
+            return
+
+        # same as `signal.send`, but timing each receiver
+        with signal_histogram(name).time():
+            for receiver in signal.receivers_for(self):
+                if self.pool is not None and self.pool.runs(name, receiver):
+                    continue
+                if inspect.iscoroutinefunction(receiver):
+                    # coroutine receivers are only awaited by `asend`
+                    raise RuntimeError('Cannot send to a coroutine function.')
+                with receiver_histogram(name, receiver).time():
+                    receiver(self, data=data, **kwargs)
+
+            if self.pool is not None:
+                self.pool.submit(name, data, self.players.get(data['id']), **kwargs)
 
-        if name == 'match_move':
-            # convert json list into tuple
-            data['move'] = tuple(data['move'])
+    def delivers(self, name: str) -> bool:
+        """Whether the events named `name` are passed to the receivers (the
+        others are only tracked)."""
+        return self.event_filter is None or self.event_filter.delivers(name)
 
+    def wanted(self, event: 'ServerSentEvent') -> bool:
+        """Whether to decode and process an event, judging from its raw data."""
+        name = event.event
         try:
             signal = self.signals[name]
         except KeyError:
-            logger.error(f'invalid event {name=}')
+            # let `send` report the invalid event
+            return True
+
+        # tracked events are processed even if no receiver gets them
+        tracked = name in self.tracked_names
+        if not tracked and not signal.receivers:
+            reason = 'no-receivers'
+        elif not tracked and not self.delivers(name):
+            reason = 'filter'
+        elif self.event_filter is not None and not self.event_filter(
+            name,
+            event.data,
+            getattr(event, 'timestamp', None),
+        ):
+            reason = 'filter'
         else:
-            signal.send(self, data=data)
+            return True
+
+        metrics.counter(
+            'watchfox_skipped_events_total',
+            'Events skipped before decoding.',
+            event=name,
+            reason=reason,
+        ).inc()
+        return False
+
+    def decode_event(self, event: 'ServerSentEvent') -> tuple[str, Any] | None:
+        if not self.wanted(event):
+            return None
+
+        name = event.event
+        try:
+            data = decode_event_data(name, event.data, self.decoding)
+        except ValueError as error:
+            logger.error('invalid %s data: %s', name, error)
+            metrics.counter(
+                'watchfox_invalid_events_total',
+                'Events whose data failed to decode.',
+                event=name,
+            ).inc()
+            return None
+
+        metrics.counter(
+            'watchfox_events_total',
+            'Events received from minifox.',
+            event=name,
+        ).inc()
+
+        # events merged from several minifox sources carry their source name
+        if (source := getattr(event, 'source', None)) is not None:
+            tag_source(data, source)
+
+        return name, data
+
+    async def aprocess_events(self, events: AsyncIterator['ServerSentEvent']):
+        """Process events asynchronously.
+
+        Events belonging to the same match are processed in order by a
+        dedicated task, while events of different matches run concurrently.
+        Flow control (`[watchfox.flow]`) and the dispatcher only apply to
+        `process_events`.
+        """
+        queues: dict[Any, asyncio.Queue[tuple[str, Any] | None]] = {}
+
+        async with asyncio.TaskGroup() as group:
+            async for event in events:
+                logger.info('processing SSE %s', event.event)
+                if (item := self.decode_event(event)) is None:
+                    continue
+
+                name, data = item
+                if (id := event_id(data)) is None:
+                    # reports the invalid event
+                    await self.ahandle(name, data)
+                    continue
+
+                try:
+                    queue = queues[id]
+                except KeyError:
+                    logger.debug('creating match task id=%r', id)
+                    queue = queues[id] = asyncio.Queue()
+                    group.create_task(self._aprocess_match(id, queue, queues))
+
+                queue.put_nowait((name, data))
+
+            for queue in queues.values():
+                queue.put_nowait(None)
+
+        if self.pool is not None:
+            await asyncio.to_thread(self.pool.join)
+
+    async def _aprocess_match(
+        self,
+        id: Any,
+        queue: asyncio.Queue[tuple[str, Any] | None],
+        queues: dict[Any, asyncio.Queue[tuple[str, Any] | None]],
+    ):
+        while (item := await queue.get()) is not None:
+            name, data = item
+            try:
+                await self.ahandle(name, data)
+            except Exception as error:
+                # one failing receiver should not cancel every other match
+                logger.exception(error)
+
+            # events queued after `match_end` (e.g., a restarted match) are
+            # still processed by this task;  the queue is only removed once it
+            # is drained, with no `await` in between, so that a later event
+            # starts a new task only after this one is done
+            if name == 'match_end' and queue.empty():
+                break
+
+        if queues.get(id) is queue:
+            del queues[id]
+
+    async def aprocess_event(self, event: 'ServerSentEvent'):
+        if (item := self.decode_event(event)) is not None:
+            await self.ahandle(*item)
+
+    async def ahandle(self, name: str, data: Any):
+        if not self.valid(name, data):
+            return
+
+        sampled = self.event_sampler.sample(name)
+        start = time.perf_counter()
+
+        kwargs = self.track(name, data)
+        try:
+            if self.delivers(name):
+                await self.asend(name, data, **kwargs)
+        finally:
+            # ended matches are evicted even if a receiver fails
+            self.untrack(name, data)
+
+        if sampled:
+            log_event(name, data, time.perf_counter() - start)
+
+    async def asend(self, name: str, data: Any, **kwargs):
+        """Run all receivers of a signal concurrently.
+
+        Coroutine receivers are awaited, while plain receivers run in a worker
+        thread so that they do not block the event loop.
+        """
+        try:
+            signal = self.signals[name]
+        except KeyError:
+            logger.error('invalid event name=%r', name)
+            return
+
+        awaitables = []
+        for receiver in signal.receivers_for(self):
+            if self.pool is not None and self.pool.runs(name, receiver):
+                continue
+            if inspect.iscoroutinefunction(receiver):
+                awaitable = receiver(self, data=data, **kwargs)
+            else:
+                awaitable = asyncio.to_thread(receiver, self, data=data, **kwargs)
+            awaitables.append(timed(awaitable, receiver_histogram(name, receiver)))
+
+        await timed(asyncio.gather(*awaitables), signal_histogram(name))
+
+        if self.pool is not None:
+            self.pool.submit(name, data, self.players.get(data['id']), **kwargs)
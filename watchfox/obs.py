@@ -1,40 +1,370 @@
+import json
 import logging
-from typing import cast
-from unittest.mock import Mock
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cached_property, partial
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Iterator, Literal, Protocol, cast, get_args
+from uuid import uuid4
 
-from obsws_python import ReqClient
+from obsws_python import EventClient, ReqClient
+from websocket import WebSocketException
+
+from watchfox.metrics import Histogram, metrics
 
 logger = logging.getLogger(__name__)
 
 
 class OBSClient(ReqClient):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # requests may come from multiple threads (e.g., async mode), and each
+        # request-response pair must not interleave on the websocket
+        self.lock = Lock()
+
     def send(self, *args, **kwargs) -> dict:
-        data = super().send(*args, **kwargs, raw=True)
+        with self.lock:
+            data = super().send(*args, **kwargs, raw=True)
         return cast(dict, data)
 
+    def send_batch(
+        self,
+        requests: list[dict[str, Any]],
+        *,
+        execution_type: int = 0,
+        halt_on_failure: bool = False,
+    ) -> list[dict]:
+        payload = {
+            'op': 8,
+            'd': {
+                'requestId': str(uuid4()),
+                'haltOnFailure': halt_on_failure,
+                'executionType': execution_type,
+                'requests': requests,
+            },
+        }
+        with self.lock:
+            self.base_client.ws.send(json.dumps(payload))
+            response = json.loads(self.base_client.ws.recv())
+        return response['d']['results']
+
+
+class OBSSender(Protocol):
+    def send(self, request_type: str, data: dict[str, Any] | None = None) -> dict: ...
+
+
+class OBSBatchSender(OBSSender, Protocol):
+    def send_batch(self, requests: list[dict[str, Any]], **kwargs) -> list[dict]: ...
+
+
+class OBSCallbackSender(Protocol):
+    """Sender which calls `on_success` once the request succeeded, which may
+    be later than `send` returns (e.g., within a batch)."""
+
+    def send(
+        self,
+        request_type: str,
+        data: dict[str, Any] | None = None,
+        on_success: Callable[[], Any] | None = None,
+    ) -> dict: ...
+
+
+type BatchExecution = Literal['serial', 'serial-frame', 'parallel']
+batch_execution_names: list[str] = list(get_args(BatchExecution.__value__))
+batch_execution_types: dict[str, int] = {
+    'serial': 0,
+    'serial-frame': 1,
+    'parallel': 2,
+}
+
+
+# errors which indicate that the websocket connection is no longer usable
+connection_errors = (WebSocketException, OSError)
+
+# requests which can safely be sent again, when it is unknown whether OBS got
+# them before the connection was lost (besides all `Get*` requests)
+idempotent_requests: frozenset[str] = frozenset(
+    [
+        'SetCurrentProgramScene',
+        'SetSourceFilterEnabled',
+    ]
+)
+idempotent_media_actions: frozenset[str] = frozenset(
+    [
+        'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY',
+        'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE',
+        'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_STOP',
+    ]
+)
+
+
+def is_idempotent(request_type: str, data: dict[str, Any] | None = None) -> bool:
+    if request_type.startswith('Get') or request_type in idempotent_requests:
+        return True
+
+    if request_type == 'TriggerMediaInputAction' and data is not None:
+        return data.get('mediaAction') in idempotent_media_actions
+
+    return False
+
+
+def request_histogram(request_type: str) -> Histogram:
+    return metrics.histogram(
+        'watchfox_obs_request_seconds',
+        'OBS request latency, including waiting for a connection.',
+        request=request_type,
+    )
+
+
+class OBSClientPool:
+    """Pool of OBS websocket connections.
+
+    Connections are created lazily (up to `size`), so that independent
+    requests coming from different threads can be sent concurrently;  when all
+    of them are busy, requests wait for one to be released or discarded.  A
+    connection which fails is discarded, and idempotent requests (see
+    `is_idempotent`) are retried once on a fresh connection.
+    """
+
+    def __init__(self, factory: Callable[[], OBSClient], size: int = 1):
+        if size < 1:
+            raise ValueError(f'invalid {size=}')
+
+        super().__init__()
+        self.factory = factory
+        self.size = size
+        self.condition = Condition()
+        self.idle: list[OBSClient] = []
+        self.connections = 0
+        # called when a connection is discarded, and when a new connection is
+        # made after that (e.g., to resynchronize state with a restarted OBS)
+        self.on_discard: Callable[[], Any] | None = None
+        self.on_reconnect: Callable[[], Any] | None = None
+        self.reconnecting = False
+
+    def acquire(self) -> OBSClient:
+        with self.condition:
+            while not self.idle and self.connections >= self.size:
+                self.condition.wait()
+
+            if self.idle:
+                return self.idle.pop()
+
+            self.connections += 1
+
+        try:
+            logger.info('making obs client')
+            client = self.factory()
+        except BaseException:
+            with self.condition:
+                self.connections -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            reconnected, self.reconnecting = self.reconnecting, False
+        if reconnected and self.on_reconnect is not None:
+            self.on_reconnect()
+
+        return client
+
+    def release(self, client: OBSClient):
+        with self.condition:
+            self.idle.append(client)
+            self.condition.notify()
+
+    def discard(self, client: OBSClient):
+        # a waiting request can now make a new connection
+        with self.condition:
+            self.connections -= 1
+            self.reconnecting = True
+            self.condition.notify()
+
+        try:
+            client.disconnect()
+        except connection_errors:
+            pass
+
+        if self.on_discard is not None:
+            self.on_discard()
+
+    def send(self, request_type: str, data: dict[str, Any] | None = None) -> dict:
+        with request_histogram(request_type).time():
+            return self.call(
+                lambda client: client.send(request_type, data),
+                retry=is_idempotent(request_type, data),
+            )
+
+    def send_batch(self, requests: list[dict[str, Any]], **kwargs) -> list[dict]:
+        retry = all(
+            is_idempotent(request['requestType'], request.get('requestData'))
+            for request in requests
+        )
+        with request_histogram('RequestBatch').time():
+            return self.call(
+                lambda client: client.send_batch(requests, **kwargs),
+                retry=retry,
+            )
+
+    def call[T](self, fn: Callable[[OBSClient], T], retry: bool = True) -> T:
+        try:
+            return self.call_once(fn)
+        except connection_errors as error:
+            metrics.counter(
+                'watchfox_obs_reconnects_total',
+                'OBS connections lost while sending a request.',
+            ).inc()
+            if not retry:
+                # OBS may have received the request already
+                logger.warning('obs connection lost (%r), not retrying', error)
+                raise
+
+            logger.warning('obs connection lost (%r), reconnecting', error)
+            return self.call_once(fn)
+
+    def call_once[T](self, fn: Callable[[OBSClient], T]) -> T:
+        client = self.acquire()
+        try:
+            response = fn(client)
+        except connection_errors:
+            self.discard(client)
+            raise
+        except BaseException:
+            self.release(client)
+            raise
+
+        self.release(client)
+        return response
+
+
+class OBSStateCache:
+    """Known OBS state, used to skip requests which would not change anything.
+
+    The state is updated both by the requests sent through the managers and by
+    the events emitted by OBS (see `subscribe`), so that changes made from
+    other clients (or from OBS itself) are also tracked.  Unknown state is
+    never assumed, i.e., the first request for each item is always sent.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = Lock()
+        self.states: dict[tuple[str, ...], Any] = {}
+        self.skipped = 0
+        self.client: EventClient | None = None
+
+    def unchanged(self, key: tuple[str, ...], value: Any) -> bool:
+        with self.lock:
+            unchanged = key in self.states and self.states[key] == value
+            if unchanged:
+                self.skipped += 1
+
+        if unchanged:
+            logger.debug('skipping redundant request key=%r value=%r', key, value)
+        return unchanged
+
+    def set(self, key: tuple[str, ...], value: Any):
+        with self.lock:
+            self.states[key] = value
+
+    def discard(self, key: tuple[str, ...]):
+        with self.lock:
+            self.states.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+
+    def subscribe(self, client: EventClient):
+        """Track the state changes emitted by OBS, replacing any previously
+        subscribed client."""
+        previous, self.client = self.client, client
+        if previous is not None:
+            try:
+                previous.disconnect()
+            except connection_errors:
+                pass
+
+        client.callback.register(
+            [
+                self.on_source_filter_enable_state_changed,
+                self.on_media_input_playback_started,
+                self.on_media_input_playback_ended,
+                self.on_media_input_action_triggered,
+                self.on_current_program_scene_changed,
+            ]
+        )
+
+    # NOTE: obsws_python dispatches events based on the callback names
+
+    def on_source_filter_enable_state_changed(self, data):
+        key = ('filter', data.source_name, data.filter_name)
+        self.set(key, data.filter_enabled)
+
+    def on_media_input_playback_started(self, data):
+        self.set(('media', data.input_name), 'OBS_MEDIA_STATE_PLAYING')
+
+    def on_media_input_playback_ended(self, data):
+        self.set(('media', data.input_name), 'OBS_MEDIA_STATE_ENDED')
+
+    def on_media_input_action_triggered(self, data):
+        key = ('media', data.input_name)
+        try:
+            self.set(key, media_action_states[data.media_action])
+        except KeyError:
+            self.discard(key)
+
+    def on_current_program_scene_changed(self, data):
+        self.set(('scene',), data.scene_name)
+
+
+media_action_states: dict[str, str] = {
+    'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY': 'OBS_MEDIA_STATE_PLAYING',
+    'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE': 'OBS_MEDIA_STATE_PAUSED',
+    'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_STOP': 'OBS_MEDIA_STATE_STOPPED',
+    'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART': 'OBS_MEDIA_STATE_PLAYING',
+}
+
 
 class OBSFilterManager:
-    def __init__(self, client: OBSClient):
+    def __init__(self, client: OBSCallbackSender, cache: OBSStateCache | None = None):
         super().__init__()
         self.client = client
+        self.cache = cache
+
+    def set_enabled(self, source: str, filter: str, enabled: bool):
+        key = ('filter', source, filter)
+        if self.cache is not None and self.cache.unchanged(key, enabled):
+            return
+
+        on_success = None
+        if self.cache is not None:
+            # only once OBS accepted the request (e.g., after a batch is sent)
+            on_success = partial(self.cache.set, key, enabled)
+
+        self.client.send(
+            'SetSourceFilterEnabled',
+            {'sourceName': source, 'filterName': filter, 'filterEnabled': enabled},
+            on_success=on_success,
+        )
 
     def enable(self, source: str, filter: str):
-        logger.info(f'enabling {source=} {filter=}')
-        self.client.set_source_filter_enabled(source, filter, True)
+        logger.info('enabling source=%r filter=%r', source, filter)
+        self.set_enabled(source, filter, True)
 
     def disable(self, source: str, filter: str):
-        logger.info(f'enabling {source=} {filter=}')
-        self.client.set_source_filter_enabled(source, filter, False)
+        logger.info('disabling source=%r filter=%r', source, filter)
+        self.set_enabled(source, filter, False)
 
 
 class OBSHotkeyManager:
-    def __init__(self, client: OBSClient):
+    def __init__(self, client: OBSSender):
         super().__init__()
         self.client = client
 
     def trigger_by_name(self, name: str):
-        logger.info(f'triggering hotkey {name=}')
-        self.client.trigger_hotkey_by_name(name)
+        logger.info('triggering hotkey name=%r', name)
+        self.client.send('TriggerHotkeyByName', {'hotkeyName': name})
 
     def trigger_by_keys(
         self,
@@ -46,74 +376,272 @@ class OBSHotkeyManager:
         cmd=False,
     ):
         # https://github.com/obsproject/obs-studio/blob/master/libobs/obs-hotkeys.h
-        logger.info(f'triggering hotkey {shift=} {ctrl=} {alt=} {cmd=} {key=}')
-        self.client.trigger_hotkey_by_key_sequence(key, shift, ctrl, alt, cmd)
+        logger.info(
+            'triggering hotkey shift=%r ctrl=%r alt=%r cmd=%r key=%r',
+            shift,
+            ctrl,
+            alt,
+            cmd,
+            key,
+        )
+        self.client.send(
+            'TriggerHotkeyByKeySequence',
+            {
+                'keyId': key,
+                'keyModifiers': {
+                    'shift': shift,
+                    'control': ctrl,
+                    'alt': alt,
+                    'command': cmd,
+                },
+            },
+        )
 
 
 class OBSMediaManager:
-    def __init__(self, client: OBSClient):
+    def __init__(self, client: OBSCallbackSender, cache: OBSStateCache | None = None):
         super().__init__()
         self.client = client
+        self.cache = cache
 
-    def play(self, name: str):
-        logger.info(f'playing media {name=}')
-        self.client.trigger_media_input_action(
-            name,
-            'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY',
+    def trigger_action(self, name: str, action: str):
+        key = ('media', name)
+        state = media_action_states.get(action)
+        # restarting always has a visible effect
+        skippable = action != 'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART'
+        if (
+            self.cache is not None
+            and skippable
+            and state is not None
+            and self.cache.unchanged(key, state)
+        ):
+            return
+
+        on_success = None
+        if self.cache is not None:
+            if state is None:
+                on_success = partial(self.cache.discard, key)
+            else:
+                on_success = partial(self.cache.set, key, state)
+
+        self.client.send(
+            'TriggerMediaInputAction',
+            {'inputName': name, 'mediaAction': action},
+            on_success=on_success,
         )
 
+    def play(self, name: str):
+        logger.info('playing media name=%r', name)
+        self.trigger_action(name, 'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY')
+
     def pause(self, name: str):
-        logger.info(f'pausing media {name=}')
-        self.client.trigger_media_input_action(
-            name,
-            'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE',
-        )
+        logger.info('pausing media name=%r', name)
+        self.trigger_action(name, 'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE')
 
     def stop(self, name: str):
-        logger.info(f'stopping media {name=}')
-        self.client.trigger_media_input_action(
-            name,
-            'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_STOP',
-        )
+        logger.info('stopping media name=%r', name)
+        self.trigger_action(name, 'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_STOP')
 
     def restart(self, name: str):
-        logger.info(f'restarting media {name=}')
-        self.client.trigger_media_input_action(
-            name,
-            'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART',
+        logger.info('restarting media name=%r', name)
+        self.trigger_action(name, 'OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART')
+
+
+class OBSSceneManager:
+    def __init__(self, client: OBSCallbackSender, cache: OBSStateCache | None = None):
+        super().__init__()
+        self.client = client
+        self.cache = cache
+
+    def set_current(self, name: str):
+        key = ('scene',)
+        if self.cache is not None and self.cache.unchanged(key, name):
+            return
+
+        logger.info('setting current scene name=%r', name)
+        on_success = None
+        if self.cache is not None:
+            on_success = partial(self.cache.set, key, name)
+
+        self.client.send(
+            'SetCurrentProgramScene',
+            {'sceneName': name},
+            on_success=on_success,
         )
 
 
+class OBSBatch:
+    """Collects requests to be sent together as a single `RequestBatch`."""
+
+    def __init__(self, execution: BatchExecution = 'serial'):
+        if execution not in batch_execution_names:
+            raise ValueError(f'invalid {execution=}')
+
+        super().__init__()
+        self.execution = execution
+        self.requests: list[dict[str, Any]] = []
+        self.callbacks: list[Callable[[], Any] | None] = []
+        self.results: list[dict] = []
+
+    def send(
+        self,
+        request_type: str,
+        data: dict[str, Any] | None = None,
+        on_success: Callable[[], Any] | None = None,
+    ) -> dict:
+        request: dict[str, Any] = {'requestType': request_type}
+        if data is not None:
+            request['requestData'] = data
+        self.requests.append(request)
+        self.callbacks.append(on_success)
+
+        # responses only become available after the batch is sent
+        return {}
+
+    def flush(self, client: OBSBatchSender) -> list[dict]:
+        if self.requests:
+            logger.info('sending batch of %d requests', len(self.requests))
+            self.results = client.send_batch(
+                self.requests,
+                execution_type=batch_execution_types[self.execution],
+            )
+            callbacks, self.requests, self.callbacks = self.callbacks, [], []
+
+            for callback, result in zip(callbacks, self.results):
+                if callback is not None and result['requestStatus']['result']:
+                    callback()
+
+        return self.results
+
+
 class OBSManager:
     # Protocols
     # https://github.com/obsproject/obs-websocket/blob/master/docs/generated/protocol.md
-    def __init__(self, client: OBSClient):
+    def __init__(self, client: OBSBatchSender, cache: OBSStateCache | None = None):
         super().__init__()
         self.client = client
+        self.cache = cache
+        # each thread or task collects its own batch
+        self.current_batch: ContextVar[OBSBatch | None] = ContextVar(
+            'current_batch',
+            default=None,
+        )
+
+    def send(
+        self,
+        request_type: str,
+        data: dict[str, Any] | None = None,
+        on_success: Callable[[], Any] | None = None,
+    ) -> dict:
+        batch = self.current_batch.get()
+        if batch is not None:
+            return batch.send(request_type, data, on_success)
 
-    @property
+        # failed requests raise
+        response = self.client.send(request_type, data)
+        if on_success is not None:
+            on_success()
+        return response
+
+    @contextmanager
+    def batch(self, execution: BatchExecution = 'serial') -> Iterator[OBSBatch]:
+        """Collect requests made within the context, and send them as a single
+        `RequestBatch` on exit;  the per-request results are then available as
+        `batch.results`.  Nested batches are merged into the outermost one."""
+        batch = self.current_batch.get()
+        if batch is not None:
+            yield batch
+            return
+
+        batch = OBSBatch(execution)
+        token = self.current_batch.set(batch)
+        try:
+            yield batch
+        finally:
+            self.current_batch.reset(token)
+
+        batch.flush(self.client)
+
+    @cached_property
     def media(self) -> OBSMediaManager:
-        return OBSMediaManager(self.client)
+        return OBSMediaManager(self, self.cache)
 
-    @property
+    @cached_property
     def hotkey(self) -> OBSHotkeyManager:
-        return OBSHotkeyManager(self.client)
+        return OBSHotkeyManager(self)
 
-    @property
+    @cached_property
     def filter(self) -> OBSFilterManager:
-        return OBSFilterManager(self.client)
+        return OBSFilterManager(self, self.cache)
 
+    @cached_property
+    def scene(self) -> OBSSceneManager:
+        return OBSSceneManager(self, self.cache)
 
-def make_obs_manager(*, mock: bool = False) -> OBSManager:
+
+def make_obs_manager(
+    *,
+    mock: bool = False,
+    pool_size: int = 1,
+    cache: bool = False,
+    lazy: bool = False,
+) -> OBSManager:
+    """Make an OBS manager.
+
+    Unless `lazy`, the first connection is made upfront (exiting if OBS is not
+    running);  otherwise it is made on a background thread, so that startup
+    does not wait for OBS, and connection errors are only logged.
+    """
     if mock:
-        return Mock()
+        from unittest.mock import MagicMock
+
+        # supports `with manager.batch(): ...`
+        return MagicMock()
+
+    pool = OBSClientPool(OBSClient, pool_size)
+    state_cache = OBSStateCache() if cache else None
+
+    def subscribe():
+        assert state_cache is not None
+        logger.info('making obs event client')
+        # the event client listens on its own thread, which keeps it alive
+        state_cache.subscribe(EventClient())
+
+    def resubscribe():
+        assert state_cache is not None
+        # OBS may have restarted, and its state changed while disconnected
+        state_cache.clear()
+        try:
+            subscribe()
+        except connection_errors as error:
+            logger.error('failed to resubscribe to obs events (%r)', error)
+
+    def connect():
+        # connect once upfront to fail early
+        pool.release(pool.acquire())
+
+        if state_cache is not None:
+            subscribe()
+
+    if state_cache is not None:
+        pool.on_discard = state_cache.clear
+        pool.on_reconnect = resubscribe
+
+    def connect_target():
+        try:
+            connect()
+        except connection_errors as error:
+            logger.error(f'failed to connect to obs ({error!r})')
+            logger.error('This probably means `obs` is not running')
 
-    try:
-        logger.info('making obs client')
-        client = OBSClient()
-    except ConnectionRefusedError as error:
-        logger.exception(error)
-        logger.error('This probably means `obs` is not running')
-        exit(1)
+    if lazy:
+        Thread(target=connect_target, daemon=True).start()
+    else:
+        try:
+            connect()
+        except ConnectionRefusedError as error:
+            logger.exception(error)
+            logger.error('This probably means `obs` is not running')
+            exit(1)
 
-    return OBSManager(client)
+    return OBSManager(pool, state_cache)
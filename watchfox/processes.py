@@ -0,0 +1,430 @@
+"""Runs CPU-bound receivers in worker processes.
+
+Receivers decorated with `cpu_bound` are not run by the `SSEProcessor` itself
+when it has a `ProcessPool`;  instead, their events are sent over a pipe to a
+worker process, chosen by match id so that the events of each match are
+handled in order.  Within the worker, receivers get a `WorkerProcessor` whose
+OBS manager and `play_audio` only record the calls made to them;  these side
+effects are sent back, and applied to the real OBS manager and audio engine by
+the main process.  When tracking state, each worker keeps its own copy of the
+state of its matches, updated from the same events as the main process, so that
+events are sent without their match state.
+
+Consequently:
+
+- CPU-bound receivers must be module-level functions (they are pickled by
+  reference, and imported again by the workers).
+- Their OBS requests return no response (as within `manager.batch()`).
+- They can only play audio clips:  the audio engine stays in the main process,
+  so the other functions of `watchfox.audio` (e.g., `configure_audio`) raise a
+  `RuntimeError` within workers.
+- Their effects are applied asynchronously, so they are ordered with respect to
+  the other CPU-bound receivers of the same match, but not with respect to the
+  in-process receivers.
+- Event data and match state are copies, which receivers cannot share with the
+  main process.
+"""
+
+import logging
+import multiprocessing
+import pickle
+import time
+import traceback
+from contextlib import contextmanager
+from multiprocessing.connection import Connection
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Literal
+
+from watchfox.metrics import metrics
+from watchfox.minifox import SSEProcessor, receiver_histogram, receiver_name
+from watchfox.state import MatchStore, PlayerIndex
+from watchfox.types import Color
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+
+    from watchfox.obs import BatchExecution, OBSManager
+
+logger = logging.getLogger(__name__)
+
+
+# attribute path of the called method (e.g., `('media', 'restart')`), and the
+# call arguments;  audio effects have paths starting with 'audio'
+type Effect = tuple[tuple[str, ...], tuple[Any, ...], dict[str, Any]]
+
+# 'track' and 'untrack' tasks update the match state kept by the worker, and
+# 'send' tasks run the receivers
+type TaskKind = Literal['track', 'untrack', 'send']
+
+# task kind, signal name, match id, players, event data, and receiver arguments
+type ProcessTask = tuple[TaskKind, str, str, PlayerIndex | None, Any, dict[str, Any]]
+
+# signal name, match id, effects, receiver durations, and error tracebacks
+type ProcessResult = tuple[str, str, list[Effect], list[float], list[str]]
+
+
+def cpu_bound[F: Callable[..., Any]](receiver: F) -> F:
+    """Mark a receiver to run in a worker process (see `ProcessPool`).
+
+    Apply it below the `connect` decorator:
+
+        @SSEProcessor.match_move.connect
+        @cpu_bound
+        def on_match_move(processor, data): ...
+    """
+    setattr(receiver, 'cpu_bound', True)
+    return receiver
+
+
+def is_cpu_bound(receiver: Callable[..., Any]) -> bool:
+    return getattr(receiver, 'cpu_bound', False)
+
+
+class EffectRecorder:
+    """Stands in for an object whose methods are called for their side effects,
+    recording each call (e.g., `manager.media.restart('intro')`) by attribute
+    path."""
+
+    __slots__ = ('_effects', '_path')
+
+    def __init__(self, effects: list[Effect], path: tuple[str, ...] = ()):
+        super().__init__()
+        self._effects = effects
+        self._path = path
+
+    def __getattr__(self, name: str) -> 'EffectRecorder':
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return EffectRecorder(self._effects, (*self._path, name))
+
+    def __call__(self, *args, **kwargs) -> dict:
+        self._effects.append((self._path, args, kwargs))
+        # responses are not available, as within a batch
+        return {}
+
+
+class RecordingManager(EffectRecorder):
+    """Stand-in for the `OBSManager` within worker processes."""
+
+    __slots__ = ()
+
+    @contextmanager
+    def batch(self, execution: 'BatchExecution' = 'serial') -> Iterator[EffectRecorder]:
+        """Record the requests made within the context as a single batch."""
+        effects: list[Effect] = []
+        self._effects.append((('batch',), (execution,), {'effects': effects}))
+
+        outer = self._effects
+        self._effects = effects
+        try:
+            yield EffectRecorder(effects)
+        finally:
+            self._effects = outer
+
+
+def apply_effects(manager: 'OBSManager', effects: list[Effect]):
+    """Replay recorded effects on the OBS manager and the audio engine."""
+    for path, args, kwargs in effects:
+        if path == ('batch',):
+            with manager.batch(*args):
+                apply_effects(manager, kwargs['effects'])
+            continue
+
+        target: Any
+        if path[0] == 'audio':
+            from watchfox.audio import get_audio_engine
+
+            target = get_audio_engine()
+            path = path[1:]
+        else:
+            target = manager
+
+        for name in path:
+            target = getattr(target, name)
+        target(*args, **kwargs)
+
+
+class WorkerProcessor:
+    """Stand-in for the `SSEProcessor` passed to receivers in worker processes,
+    with the same `manager`, `config`, `players` and `nick_color`."""
+
+    def __init__(self, config: dict[str, Any]):
+        super().__init__()
+        self.config = config
+        self.effects: list[Effect] = []
+        self.manager = RecordingManager(self.effects)
+        # only holds the players of the match being handled
+        self.players: dict[str, PlayerIndex] = {}
+
+    def nick_color(self, id: str, nick: str) -> Color | None:
+        try:
+            return self.players[id].color(nick)
+        except KeyError:
+            return None
+
+
+def no_audio_engine():
+    raise RuntimeError(
+        'the audio engine runs in the main process;  CPU-bound receivers can '
+        'only use `play_audio`'
+    )
+
+
+def worker_main(
+    pickled_receivers: bytes,
+    config: dict[str, Any],
+    tasks: Connection,
+    results: Connection,
+):
+    import signal
+
+    # the main process handles interrupts, and then stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    processor = WorkerProcessor(config)
+
+    # `play_audio` (even if imported lazily) records the clips played, while
+    # the rest of the audio engine is not available;  the receivers are only
+    # loaded afterwards, so that they also import the recording `play_audio`
+    try:
+        import watchfox.audio
+    except ImportError:
+        pass
+    else:
+        recorder = EffectRecorder(processor.effects, ('audio', 'play'))
+        watchfox.audio.play_audio = recorder  # type: ignore
+        watchfox.audio.get_audio_engine = no_audio_engine  # type: ignore
+
+    receivers: dict[str, list[Callable[..., Any]]] = pickle.loads(pickled_receivers)
+    matches = MatchStore()
+
+    while (task := tasks.recv()) is not None:
+        kind, name, id, players, data, kwargs = task
+        if kind == 'track':
+            try:
+                matches.update(name, data)
+            except Exception:
+                logger.exception('failed to track %s id=%r', name, id)
+            continue
+        if kind == 'untrack':
+            matches.evict(id)
+            continue
+
+        processor.players = {} if players is None else {id: players}
+        if id in matches:
+            kwargs['state'] = matches[id]
+
+        durations: list[float] = []
+        errors: list[str] = []
+        for receiver in receivers[name]:
+            start = time.perf_counter()
+            try:
+                receiver(processor, data=data, **kwargs)
+            except Exception:
+                errors.append(traceback.format_exc())
+            durations.append(time.perf_counter() - start)
+
+        results.send((name, id, processor.effects, durations, errors))
+        processor.effects.clear()
+
+    results.send(None)
+
+
+class ProcessShard:
+    def __init__(
+        self,
+        context: multiprocessing.context.BaseContext,
+        pickled_receivers: bytes,
+        config: dict[str, Any],
+    ):
+        super().__init__()
+        # `lock` guards the count of pending events, and `write_lock` the pipe
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.pending = 0
+
+        # each pipe has a reading and a writing end
+        task_reader, self.tasks = context.Pipe(duplex=False)
+        self.results, result_writer = context.Pipe(duplex=False)
+        self.process: 'BaseProcess' = context.Process(  # type: ignore
+            target=worker_main,
+            args=(pickled_receivers, config, task_reader, result_writer),
+            daemon=True,
+        )
+        self.process.start()
+
+        # so that reading the results fails if the worker exits
+        task_reader.close()
+        result_writer.close()
+
+    def send(self, task: ProcessTask | None):
+        counted = task is not None and task[0] == 'send'
+        if counted:
+            with self.lock:
+                self.pending += 1
+
+        # writing blocks while the pipe is full, i.e., until the worker reads
+        # more tasks, which in turn may wait for the collector thread to read
+        # their results;  so the collector must not wait for the pipe
+        try:
+            with self.write_lock:
+                self.tasks.send(task)
+        except OSError:
+            if counted:
+                with self.lock:
+                    self.pending -= 1
+            raise
+
+
+class ProcessPool:
+    """Runs the `cpu_bound` receivers on a pool of worker processes, sharded
+    by match id.
+
+    The receivers are collected from the `SSEProcessor` signals when the pool
+    is created (receivers connected later run in-process).  Each worker reads
+    its events from a pipe, and writes back the recorded side effects, which a
+    thread per worker applies to the manager.  The `SSEProcessor` also passes
+    the events which update the match state to the pool (`track`, `untrack`),
+    so that the workers keep their own copy of the state.
+    """
+
+    def __init__(
+        self,
+        manager: 'OBSManager',
+        config: dict[str, Any] | None = None,
+        workers: int = 2,
+    ):
+        if workers < 1:
+            raise ValueError(f'invalid {workers=}')
+
+        super().__init__()
+        self.manager = manager
+
+        self.receivers: dict[str, list[Callable[..., Any]]] = {}
+        for name, signal in SSEProcessor.signals.items():
+            receivers = [r for r in signal.receivers_for(None) if is_cpu_bound(r)]
+            if receivers:
+                self.receivers[name] = receivers
+
+        for receivers in self.receivers.values():
+            for receiver in receivers:
+                try:
+                    pickle.dumps(receiver)
+                except (pickle.PicklingError, AttributeError, TypeError):
+                    raise ValueError(
+                        f'CPU-bound receiver {receiver_name(receiver)} is not a '
+                        'module-level function'
+                    )
+
+        self.names = frozenset(self.receivers)
+        self.receiver_sets = {
+            name: frozenset(receivers) for name, receivers in self.receivers.items()
+        }
+        if not self.names:
+            logger.warning('no CPU-bound receivers, not starting worker processes')
+            workers = 0
+
+        # forking a process with running threads (e.g., the OBS client) is
+        # unsafe, so workers start from scratch and import the receivers
+        context = multiprocessing.get_context('spawn')
+        config = {} if config is None else config
+        pickled_receivers = pickle.dumps(self.receivers)
+        self.shards = [
+            ProcessShard(context, pickled_receivers, config) for _ in range(workers)
+        ]
+        self.threads = [
+            Thread(target=self.collect_target, args=(shard,), daemon=True)
+            for shard in self.shards
+        ]
+        for thread in self.threads:
+            thread.start()
+
+        metrics.gauge(
+            'watchfox_process_pending',
+            lambda: sum(shard.pending for shard in self.shards),
+            'Events sent to worker processes, whose effects are not yet applied.',
+        )
+
+    def runs(self, name: str, receiver: Callable[..., Any]) -> bool:
+        """Whether the pool runs this receiver of signal `name`."""
+        return receiver in self.receiver_sets.get(name, ())
+
+    def submit(
+        self,
+        name: str,
+        data: Any,
+        players: PlayerIndex | None = None,
+        **kwargs,
+    ):
+        """Send an event to the worker of its match, if any receiver wants it."""
+        if name not in self.names:
+            return
+
+        # the workers pass their own copy of the match state
+        kwargs.pop('state', None)
+        self.send(('send', name, data['id'], players, data, kwargs))
+
+    def track(self, name: str, data: Any):
+        """Update the match state kept by the worker of the event's match."""
+        if self.names:
+            self.send(('track', name, data['id'], None, data, {}))
+
+    def untrack(self, id: str):
+        """Drop the match state kept by the worker of match `id`."""
+        if self.names:
+            self.send(('untrack', '', id, None, None, {}))
+
+    def send(self, task: ProcessTask):
+        kind, name, id, *_ = task
+        shard = self.shards[hash(id) % len(self.shards)]
+        try:
+            shard.send(task)
+        except OSError as error:
+            logger.error('worker gone, dropping %s %s id=%r: %r', kind, name, id, error)
+
+    def collect_target(self, shard: ProcessShard):
+        receivers = self.receivers
+        while True:
+            try:
+                result: ProcessResult | None = shard.results.recv()
+            except EOFError:
+                logger.error('worker process %s exited', shard.process.pid)
+                break
+
+            if result is None:
+                break
+
+            name, id, effects, durations, errors = result
+            for receiver, duration in zip(receivers[name], durations):
+                receiver_histogram(name, receiver).observe(duration)
+            for error in errors:
+                logger.error(
+                    'CPU-bound receiver failed on %s id=%r\n%s',
+                    name,
+                    id,
+                    error,
+                )
+
+            try:
+                apply_effects(self.manager, effects)
+            except Exception as error:
+                logger.exception(error)
+
+            with shard.lock:
+                shard.pending -= 1
+
+    def join(self):
+        """Wait for all submitted events to be handled, and their effects to be
+        applied, and stop the workers."""
+        for shard in self.shards:
+            try:
+                shard.send(None)
+            except OSError:
+                pass
+
+        for thread in self.threads:
+            thread.join()
+
+        for shard in self.shards:
+            shard.process.join()
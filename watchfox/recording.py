@@ -0,0 +1,356 @@
+"""Recording format for server-sent events.
+
+A recording consists of a file magic followed by length-prefixed records, each
+made of a fixed-size header (arrival timestamp and field lengths) followed by
+the utf-8 encoded event name, event id, and event data.  Records can be read
+without unpickling arbitrary objects, and without decoding the event data.
+
+Each recording has a sidecar index (the recording filename with an added
+`.idx` suffix) with one line per record containing its byte offset, size,
+timestamp, event name, and match id;  this allows readers to seek directly to
+the relevant records.  The index can always be rebuilt from the recording.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, BinaryIO, Collection, Iterator, Self
+
+if TYPE_CHECKING:
+    from httpx_sse import ServerSentEvent
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'WATCHFOX-SSE\x01\n'
+# timestamp, data length, name length, id length
+HEADER = struct.Struct('<dIHH')
+
+
+class RecordedEvent:
+    """Recorded event, with the same interface as `ServerSentEvent` (which is
+    not subclassed, so that reading recordings does not import httpx)."""
+
+    __slots__ = ('event', 'data', 'id', 'retry', 'timestamp')
+
+    def __init__(
+        self,
+        event: str = 'message',
+        data: str = '',
+        id: str = '',
+        retry: int | None = None,
+        *,
+        timestamp: float,
+    ):
+        super().__init__()
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+        self.timestamp = timestamp
+
+    def json(self) -> Any:
+        return json.loads(self.data)
+
+    def __repr__(self) -> str:
+        return f'RecordedEvent(event={self.event!r}, timestamp={self.timestamp!r})'
+
+
+class RecordView:
+    """Lazy, read-only view of a record in a memory-mapped recording.
+
+    Provides the same interface as `ServerSentEvent`, but the record fields are
+    only decoded when accessed, and the event data JSON is decoded at most once.
+    """
+
+    __slots__ = ('buffer', 'timestamp', 'start', 'name_end', 'id_end', 'end', '_json')
+
+    def __init__(self, buffer: mmap.mmap, offset: int):
+        super().__init__()
+        self.buffer = buffer
+        self.timestamp, data_size, name_size, id_size = HEADER.unpack_from(
+            buffer, offset
+        )
+        self.start = offset + HEADER.size
+        self.name_end = self.start + name_size
+        self.id_end = self.name_end + id_size
+        self.end = self.id_end + data_size
+        self._json: Any = None
+
+    @property
+    def event(self) -> str:
+        return self.buffer[self.start : self.name_end].decode()
+
+    @property
+    def id(self) -> str:
+        return self.buffer[self.name_end : self.id_end].decode()
+
+    @property
+    def data(self) -> str:
+        return self.buffer[self.id_end : self.end].decode()
+
+    @property
+    def retry(self) -> int | None:
+        return None
+
+    def json(self) -> Any:
+        if self._json is None:
+            self._json = json.loads(self.buffer[self.id_end : self.end])
+        return self._json
+
+    def __repr__(self) -> str:
+        return f'RecordView(event={self.event!r}, timestamp={self.timestamp!r})'
+
+
+@dataclass(frozen=True, slots=True)
+class IndexEntry:
+    offset: int
+    size: int
+    timestamp: float
+    name: str
+    match_id: str
+
+    def dumps(self) -> str:
+        return (
+            f'{self.offset}\t{self.size}\t{self.timestamp!r}'
+            f'\t{self.name}\t{self.match_id}\n'
+        )
+
+    @classmethod
+    def loads(cls, line: str) -> Self:
+        offset, size, timestamp, name, match_id = line.rstrip('\n').split('\t')
+        return cls(int(offset), int(size), float(timestamp), name, match_id)
+
+
+def get_index_filename(filename: str) -> str:
+    return f'{filename}.idx'
+
+
+def get_match_id(event: 'ServerSentEvent') -> str:
+    try:
+        return str(event.json()['id'])
+    except (ValueError, TypeError, KeyError):
+        return ''
+
+
+def encode_record(event: 'ServerSentEvent', timestamp: float) -> bytes:
+    name = event.event.encode()
+    id = event.id.encode()
+    data = event.data.encode()
+    header = HEADER.pack(timestamp, len(data), len(name), len(id))
+    return b''.join([header, name, id, data])
+
+
+def read_record(f: BinaryIO) -> RecordedEvent | None:
+    header = f.read(HEADER.size)
+    if not header:
+        return None
+
+    if len(header) < HEADER.size:
+        raise ValueError('truncated record header')
+
+    timestamp, data_size, name_size, id_size = HEADER.unpack(header)
+    body = f.read(name_size + id_size + data_size)
+    if len(body) < name_size + id_size + data_size:
+        raise ValueError('truncated record body')
+
+    name = body[:name_size].decode()
+    id = body[name_size : name_size + id_size].decode()
+    data = body[name_size + id_size :].decode()
+    return RecordedEvent(name, data, id, timestamp=timestamp)
+
+
+def check_magic(f: BinaryIO, filename: str):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'`{filename}` is not a watchfox recording')
+
+
+class RecordWriter:
+    def __init__(self, filename: str, append: bool = False):
+        super().__init__()
+
+        index_filename = get_index_filename(filename)
+        append = append and os.path.exists(filename)
+        if append and not os.path.exists(index_filename):
+            build_index(filename)
+
+        mode = 'ab' if append else 'wb'
+        self.file = open(filename, mode)
+        self.index_file = open(index_filename, mode[0])
+
+        if not append:
+            self.file.write(MAGIC)
+
+        self.offset = self.file.tell()
+
+    def write(self, event: 'ServerSentEvent', timestamp: float | None = None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        record = encode_record(event, timestamp)
+        entry = IndexEntry(
+            self.offset,
+            len(record),
+            timestamp,
+            event.event,
+            get_match_id(event),
+        )
+
+        self.file.write(record)
+        self.index_file.write(entry.dumps())
+        # keep recording and index consistent if the process gets killed
+        self.file.flush()
+        self.index_file.flush()
+        self.offset += len(record)
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_index(filename: str) -> list[IndexEntry]:
+    logger.info(f'building index for `{filename}`')
+
+    entries = []
+    with open(filename, 'rb') as f:
+        check_magic(f, filename)
+
+        offset = f.tell()
+        while (event := read_record(f)) is not None:
+            size = f.tell() - offset
+            entry = IndexEntry(
+                offset,
+                size,
+                event.timestamp,
+                event.event,
+                get_match_id(event),
+            )
+            entries.append(entry)
+            offset += size
+
+    with open(get_index_filename(filename), 'w') as f:
+        f.writelines(entry.dumps() for entry in entries)
+
+    return entries
+
+
+def read_index(filename: str) -> list[IndexEntry]:
+    try:
+        with open(get_index_filename(filename)) as f:
+            entries = [IndexEntry.loads(line) for line in f]
+    except (FileNotFoundError, ValueError):
+        return build_index(filename)
+
+    # an index which does not cover the whole recording is stale
+    end = entries[-1].offset + entries[-1].size if entries else len(MAGIC)
+    if end != os.path.getsize(filename):
+        return build_index(filename)
+
+    return entries
+
+
+def filter_index(
+    entries: list[IndexEntry],
+    *,
+    names: Collection[str] | None = None,
+    match_ids: Collection[str] | None = None,
+    start: float | None = None,
+    end: float | None = None,
+) -> Iterator[IndexEntry]:
+    """Filter index entries;  `start` and `end` are in seconds relative to the
+    first record of the recording."""
+    t0 = entries[0].timestamp if entries else 0.0
+
+    for entry in entries:
+        if names is not None and entry.name not in names:
+            continue
+
+        if match_ids is not None and entry.match_id not in match_ids:
+            continue
+
+        if start is not None and entry.timestamp - t0 < start:
+            continue
+
+        if end is not None and entry.timestamp - t0 > end:
+            # records are in chronological order
+            break
+
+        yield entry
+
+
+def write_records(filename: str, append: bool, events: Iterator['ServerSentEvent']):
+    with RecordWriter(filename, append) as writer:
+        for event in events:
+            writer.write(event)
+
+
+def map_recording(filename: str) -> mmap.mmap:
+    with open(filename, 'rb') as f:
+        check_magic(f, filename)
+        # the mapping stays valid after the file is closed, and is unmapped
+        # when the last view referencing it is garbage collected
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_records(
+    filename: str,
+    *,
+    names: Collection[str] | None = None,
+    match_ids: Collection[str] | None = None,
+    start: float | None = None,
+    end: float | None = None,
+) -> Iterator[RecordView]:
+    if match_ids is not None or start is not None or end is not None:
+        yield from read_indexed_records(
+            filename,
+            names=names,
+            match_ids=match_ids,
+            start=start,
+            end=end,
+        )
+        return
+
+    # without match or time filters, scanning the record headers is cheaper
+    # than loading the index, and keeps memory constant
+    buffer = map_recording(filename)
+    name_filter = None if names is None else {name.encode() for name in names}
+
+    offset = len(MAGIC)
+    while offset < len(buffer):
+        view = RecordView(buffer, offset)
+        offset = view.end
+
+        if name_filter is None or buffer[view.start : view.name_end] in name_filter:
+            yield view
+
+
+def read_indexed_records(
+    filename: str,
+    *,
+    names: Collection[str] | None = None,
+    match_ids: Collection[str] | None = None,
+    start: float | None = None,
+    end: float | None = None,
+) -> Iterator[RecordView]:
+    entries = read_index(filename)
+    entries = filter_index(
+        entries,
+        names=names,
+        match_ids=match_ids,
+        start=start,
+        end=end,
+    )
+
+    buffer = map_recording(filename)
+    for entry in entries:
+        yield RecordView(buffer, entry.offset)
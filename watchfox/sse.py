@@ -1,49 +1,409 @@
+import asyncio
 import logging
-import pickle
+import queue
+import random
+import threading
+import time
 import tomllib
-from contextlib import contextmanager
-from typing import Iterator, cast
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Collection,
+    Iterable,
+    Iterator,
+    Mapping,
+    Self,
+    cast,
+)
 
 import httpx
-from httpx_sse import EventSource, ServerSentEvent, connect_sse
+from httpx_sse import (
+    EventSource,
+    ServerSentEvent,
+    SSEError,
+    aconnect_sse,
+    connect_sse,
+)
+
+from watchfox.recording import RecordView, read_records, write_records
 
 logger = logging.getLogger('__name__')
 
 
+# errors after which reconnecting may help
+reconnect_errors = (httpx.TransportError, httpx.HTTPStatusError, SSEError)
+
+
 @contextmanager
-def make_event_source(url: str) -> Iterator[EventSource]:
+def make_event_source(url: str, **kwargs) -> Iterator[EventSource]:
     with httpx.Client(timeout=None) as client:
-        try:
-            with connect_sse(client, 'GET', url) as event_source:
-                yield event_source
-        except (httpx.ConnectError, httpx.ReadError) as error:
-            logger.exception(error)
+        with connect_sse(client, 'GET', url, **kwargs) as event_source:
+            event_source.response.raise_for_status()
+            yield event_source
+
+
+@asynccontextmanager
+async def make_async_event_source(url: str, **kwargs) -> AsyncIterator[EventSource]:
+    async with httpx.AsyncClient(timeout=None) as client:
+        async with aconnect_sse(client, 'GET', url, **kwargs) as event_source:
+            event_source.response.raise_for_status()
+            yield event_source
+
+
+@dataclass(frozen=True)
+class ReconnectPolicy:
+    """Reconnect settings, read from the `[minifoxwq.reconnect]` config section.
+
+    The delay before each reconnect attempt grows exponentially from
+    `initial_delay` up to `max_delay`, and is randomized by up to `jitter`
+    (as a fraction of the delay) so that clients do not reconnect in lockstep.
+    A `retry:` field sent by the server replaces `initial_delay`.  After
+    `max_attempts` consecutive failed attempts the last error is raised.
+    """
+
+    initial_delay: float = 0.5
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    jitter: float = 0.5
+    max_attempts: int | None = None
+    # number of recent event ids remembered to drop replayed events
+    history: int = 1024
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> Self:
+        return cls(**config)
+
+    def delay(self, attempt: int, initial_delay: float | None = None) -> float:
+        if initial_delay is None:
+            initial_delay = self.initial_delay
+
+        delay = min(self.max_delay, initial_delay * self.multiplier**attempt)
+        return delay * (1 - self.jitter * random.random())
+
+
+@dataclass
+class ReconnectStats:
+    connects: int = 0
+    reconnects: int = 0
+    failures: int = 0
+    duplicates: int = 0
+    # total seconds spent disconnected
+    downtime: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f'{self.reconnects} reconnects, {self.failures} failed attempts, '
+            f'{self.duplicates} duplicates, {self.downtime:.1f}s downtime'
+        )
+
+
+class ReconnectingEventSource:
+    """Server-sent events which survive connection loss.
+
+    Whenever the connection fails or the stream ends, the source reconnects
+    with exponential backoff, sending the id of the last received event as
+    `Last-Event-ID` so that the server can resume the stream.  Events whose ids
+    were already received (i.e., replayed by the server) are dropped.
+    """
+
+    def __init__(self, url: str, policy: ReconnectPolicy | None = None):
+        super().__init__()
+        self.url = url
+        self.policy = ReconnectPolicy() if policy is None else policy
+        self.stats = ReconnectStats()
+        self.last_event_id = ''
+        # server-provided `retry:` delay, in seconds
+        self.retry: float | None = None
+        self.attempt = 0
+        self.down_since: float | None = None
+        self.duplicate = False
+        self.seen_ids: set[str] = set()
+        self.recent_ids: deque[str] = deque()
+
+    @property
+    def headers(self) -> dict[str, str]:
+        if not self.last_event_id:
+            return {}
+
+        return {'Last-Event-ID': self.last_event_id}
+
+    def connected(self):
+        if self.down_since is not None:
+            self.stats.downtime += time.monotonic() - self.down_since
+            self.down_since = None
+            self.stats.reconnects += 1
+            logger.warning('reconnected to %s: %s', self.url, self.stats)
+
+        self.stats.connects += 1
+        self.attempt = 0
+        self.duplicate = False
+
+    def disconnected(self, error: Exception | None) -> float:
+        """Record a lost connection or failed attempt, and return the delay
+        before the next attempt (or raise once out of attempts)."""
+        if self.down_since is None:
+            self.down_since = time.monotonic()
+        if error is not None:
+            self.stats.failures += 1
+
+        max_attempts = self.policy.max_attempts
+        if max_attempts is not None and self.attempt >= max_attempts:
             logger.error('This probably means `minifox` is not running')
-            exit(1)
+            if error is None:
+                raise ConnectionError(f'lost connection to {self.url}')
+            raise error
+
+        delay = self.policy.delay(self.attempt, self.retry)
+        self.attempt += 1
+
+        if error is None:
+            logger.warning('stream from %s ended;  reconnecting', self.url)
+        else:
+            logger.warning(
+                f'connection to {self.url} failed ({error!r});  '
+                f'reconnecting in {delay:.1f}s'
+            )
+        return delay
+
+    def accept(self, event: ServerSentEvent, previous_id: str) -> bool:
+        """Track `retry:` and event ids, and tell whether to yield the event."""
+        if event.retry is not None:
+            self.retry = event.retry / 1000
 
+        # events without an `id:` field inherit the previous id, and share its
+        # fate;  a new id which was already seen means the event was replayed
+        if event.id != previous_id:
+            self.duplicate = event.id in self.seen_ids
+            if event.id and not self.duplicate:
+                self.last_event_id = event.id
+                self.seen_ids.add(event.id)
+                self.recent_ids.append(event.id)
+                if len(self.recent_ids) > self.policy.history:
+                    self.seen_ids.discard(self.recent_ids.popleft())
 
-def server_sent_events(url: str | None = None) -> Iterator[ServerSentEvent]:
+        if self.duplicate:
+            self.stats.duplicates += 1
+            return False
+
+        # events without data (e.g., only a `retry:` field) are not dispatched
+        return bool(event.data)
+
+    def __iter__(self) -> Iterator[ServerSentEvent]:
+        while True:
+            try:
+                with make_event_source(self.url, headers=self.headers) as source:
+                    if source.response.status_code == 204:
+                        # the server asked us not to reconnect
+                        return
+
+                    self.connected()
+                    previous_id = ''
+                    for event in source.iter_sse():
+                        if self.accept(event, previous_id):
+                            yield event
+                        previous_id = event.id
+            except reconnect_errors as error:
+                delay = self.disconnected(error)
+            else:
+                delay = self.disconnected(None)
+
+            time.sleep(delay)
+
+    async def __aiter__(self) -> AsyncIterator[ServerSentEvent]:
+        while True:
+            try:
+                async with make_async_event_source(
+                    self.url, headers=self.headers
+                ) as source:
+                    if source.response.status_code == 204:
+                        return
+
+                    self.connected()
+                    previous_id = ''
+                    async for event in source.aiter_sse():
+                        if self.accept(event, previous_id):
+                            yield event
+                        previous_id = event.id
+            except reconnect_errors as error:
+                delay = self.disconnected(error)
+            else:
+                delay = self.disconnected(None)
+
+            await asyncio.sleep(delay)
+
+
+class SourcedEvent(ServerSentEvent):
+    """Server-sent event tagged with the name of the source it came from."""
+
+    def __init__(self, *args, source: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.source = source
+
+    @classmethod
+    def from_event(cls, event: ServerSentEvent, source: str) -> Self:
+        return cls(event.event, event.data, event.id, event.retry, source=source)
+
+
+def merge_event_sources(
+    sources: Mapping[str, Iterable[ServerSentEvent]],
+    maxsize: int = 1024,
+) -> Iterator[SourcedEvent]:
+    """Read several event sources concurrently (one thread each), yielding
+    their events tagged with the source names in arrival order.
+
+    If a source fails, its error is raised once the events received before the
+    failure have been yielded.
+    """
+    events: queue.Queue[SourcedEvent | Exception | None] = queue.Queue(maxsize)
+
+    def reader_target(name: str, source: Iterable[ServerSentEvent]):
+        try:
+            for event in source:
+                events.put(SourcedEvent.from_event(event, name))
+        except Exception as error:
+            events.put(error)
+        else:
+            logger.info('source %s ended', name)
+            events.put(None)
+
+    for name, source in sources.items():
+        reader = threading.Thread(
+            target=reader_target,
+            args=(name, source),
+            name=f'sse-{name}',
+            daemon=True,
+        )
+        reader.start()
+
+    remaining = len(sources)
+    while remaining:
+        item = events.get()
+        if item is None:
+            remaining -= 1
+        elif isinstance(item, Exception):
+            raise item
+        else:
+            yield item
+
+
+async def amerge_event_sources(
+    sources: Mapping[str, AsyncIterable[ServerSentEvent]],
+    maxsize: int = 1024,
+) -> AsyncIterator[SourcedEvent]:
+    """Asynchronous counterpart of `merge_event_sources`, with one task per
+    source."""
+    events: asyncio.Queue[SourcedEvent | Exception | None] = asyncio.Queue(maxsize)
+
+    async def read(name: str, source: AsyncIterable[ServerSentEvent]):
+        try:
+            async for event in source:
+                await events.put(SourcedEvent.from_event(event, name))
+        except Exception as error:
+            await events.put(error)
+        else:
+            logger.info('source %s ended', name)
+            await events.put(None)
+
+    tasks = [
+        asyncio.create_task(read(name, source), name=f'sse-{name}')
+        for name, source in sources.items()
+    ]
+
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await events.get()
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def get_minifox_config() -> dict[str, Any]:
+    with open('config.toml', 'rb') as f:
+        config = tomllib.load(f)
+
+    return cast(dict[str, Any], config['minifoxwq'])
+
+
+def get_sse_url() -> str:
+    return cast(str, get_minifox_config()['sse_url'])
+
+
+def make_reconnecting_event_source(
+    url: str | None = None,
+    policy: ReconnectPolicy | None = None,
+) -> ReconnectingEventSource:
     if url is None:
-        with open('config.toml', 'rb') as f:
-            config = tomllib.load(f)
+        config = get_minifox_config()
+        url = cast(str, config['sse_url'])
+        if policy is None:
+            policy = ReconnectPolicy.from_config(config.get('reconnect', {}))
+
+    return ReconnectingEventSource(url, policy)
+
 
-        url = cast(str, config['minifoxwq']['sse_url'])
+def server_sent_events(
+    url: str | None = None,
+    *,
+    reconnect: bool = True,
+    policy: ReconnectPolicy | None = None,
+) -> Iterator[ServerSentEvent]:
+    if reconnect:
+        yield from make_reconnecting_event_source(url, policy)
+        return
+
+    if url is None:
+        url = get_sse_url()
 
     with make_event_source(url) as event_source:
         yield from event_source.iter_sse()
 
 
+async def async_server_sent_events(
+    url: str | None = None,
+    *,
+    reconnect: bool = True,
+    policy: ReconnectPolicy | None = None,
+) -> AsyncIterator[ServerSentEvent]:
+    if reconnect:
+        async for event in make_reconnecting_event_source(url, policy):
+            yield event
+        return
+
+    if url is None:
+        url = get_sse_url()
+
+    async with make_async_event_source(url) as event_source:
+        async for event in event_source.aiter_sse():
+            yield event
+
+
 def record_events(filename: str, append: bool, events: Iterator[ServerSentEvent]):
-    mode = 'ab' if append else 'wb'
-    with open(filename, mode) as f:
-        for event in events:
-            pickle.dump(event, f)
+    write_records(filename, append, events)
 
 
-def get_recorded_events(filename: str) -> Iterator[ServerSentEvent]:
-    with open(filename, 'rb') as f:
-        while True:
-            try:
-                yield pickle.load(f)
-            except EOFError:
-                break
+def get_recorded_events(
+    filename: str,
+    *,
+    names: Collection[str] | None = None,
+    match_ids: Collection[str] | None = None,
+    start: float | None = None,
+    end: float | None = None,
+) -> Iterator[RecordView]:
+    return read_records(
+        filename,
+        names=names,
+        match_ids=match_ids,
+        start=start,
+        end=end,
+    )
@@ -0,0 +1,191 @@
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Final, Self
+
+from watchfox.types import Color
+
+logger = logging.getLogger(__name__)
+
+
+EMPTY: Final = 0
+BLACK: Final = 1
+WHITE: Final = 2
+
+turn_to_color: Final[dict[str, Color]] = {'B': 'black', 'W': 'white'}
+color_to_stone: Final[dict[Color, int]] = {'black': BLACK, 'white': WHITE}
+
+
+class Board:
+    """Go board backed by a flat bytearray, with captures."""
+
+    __slots__ = ('size', 'cells')
+
+    def __init__(self, size: int = 19):
+        super().__init__()
+        self.size = size
+        self.cells = bytearray(size * size)
+
+    def __getitem__(self, point: tuple[int, int]) -> int:
+        row, col = point
+        return self.cells[row * self.size + col]
+
+    def neighbors(self, index: int) -> list[int]:
+        row, col = divmod(index, self.size)
+        neighbors = []
+        if row > 0:
+            neighbors.append(index - self.size)
+        if row < self.size - 1:
+            neighbors.append(index + self.size)
+        if col > 0:
+            neighbors.append(index - 1)
+        if col < self.size - 1:
+            neighbors.append(index + 1)
+        return neighbors
+
+    def group(self, index: int) -> tuple[list[int], bool]:
+        """Stones connected to `index`, and whether they have any liberty."""
+        stone = self.cells[index]
+        stones = [index]
+        visited = {index}
+        liberty = False
+
+        for i in stones:
+            for neighbor in self.neighbors(i):
+                cell = self.cells[neighbor]
+                if cell == EMPTY:
+                    liberty = True
+                elif cell == stone and neighbor not in visited:
+                    visited.add(neighbor)
+                    stones.append(neighbor)
+
+        return stones, liberty
+
+    def play(self, row: int, col: int, stone: int) -> list[tuple[int, int]]:
+        """Place a stone, and return the points of the captured stones."""
+        index = row * self.size + col
+        self.cells[index] = stone
+        opponent = BLACK + WHITE - stone
+
+        captured: list[int] = []
+        for neighbor in self.neighbors(index):
+            if self.cells[neighbor] == opponent:
+                stones, liberty = self.group(neighbor)
+                if not liberty:
+                    captured.extend(stones)
+
+        if not captured:
+            # suicide, if the rules allowed it
+            stones, liberty = self.group(index)
+            if not liberty:
+                captured = stones
+
+        for i in captured:
+            self.cells[i] = EMPTY
+
+        return [divmod(i, self.size) for i in set(captured)]
+
+
+@dataclass(frozen=True, slots=True)
+class PlayerIndex:
+    """Players of a match, indexed both by nick and by color."""
+
+    colors: dict[str, Color]
+    players: dict[Color, Any]
+
+    @classmethod
+    def from_match_start(cls, data: Any) -> Self:
+        players: dict[Color, Any] = {'black': data['black'], 'white': data['white']}
+        colors = {player['nick']: color for color, player in players.items()}
+        return cls(colors, players)
+
+    def color(self, nick: str) -> Color | None:
+        """Color played by `nick`, or None if `nick` is not playing."""
+        return self.colors.get(nick)
+
+    def player(self, color: Color) -> Any:
+        return self.players[color]
+
+
+@dataclass
+class MatchState:
+    id: str
+    board: Board
+    start: Any = None
+    moves: list[tuple[int, int]] = field(default_factory=list)
+    captures: dict[Color, int] = field(default_factory=lambda: dict(black=0, white=0))
+    time: Any = None
+    chat: deque[Any] = field(default_factory=deque)
+
+    @property
+    def settings(self) -> Any:
+        return None if self.start is None else self.start['settings']
+
+
+class MatchStore:
+    """Incrementally updated state of each ongoing match, keyed by match id."""
+
+    def __init__(self, chat_history: int = 100):
+        super().__init__()
+        self.chat_history = chat_history
+        self.matches: dict[str, MatchState] = {}
+
+    def __getitem__(self, id: str) -> MatchState:
+        return self.matches[id]
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.matches
+
+    def __len__(self) -> int:
+        return len(self.matches)
+
+    def get_or_create(self, id: str, board_size: int = 19) -> MatchState:
+        try:
+            return self.matches[id]
+        except KeyError:
+            logger.debug('creating match state id=%r', id)
+            state = MatchState(
+                id,
+                Board(board_size),
+                chat=deque(maxlen=self.chat_history),
+            )
+            self.matches[id] = state
+            return state
+
+    def update(self, name: str, data: Any) -> MatchState:
+        id = data['id']
+
+        if name == 'match_start':
+            # a restarted match starts from scratch
+            self.matches.pop(id, None)
+            state = self.get_or_create(id, data['settings']['board_size'])
+            state.start = data
+            return state
+
+        # matches which started before watchfox get tracked from their first event
+        state = self.get_or_create(id)
+
+        match name:
+            case 'match_move':
+                row, col = move = tuple(data['move'])
+                state.moves.append(move)
+                # passes are encoded as (-1, -1)
+                if row >= 0 and col >= 0:
+                    # `turn` is the color of the player making the move
+                    color = turn_to_color[data['turn']]
+                    captured = state.board.play(row, col, color_to_stone[color])
+                    # a suicide only removes the mover's own stones
+                    if state.board[row, col] != EMPTY:
+                        state.captures[color] += len(captured)
+
+            case 'match_time':
+                state.time = data
+
+            case 'match_chat':
+                state.chat.append(data)
+
+        return state
+
+    def evict(self, id: str):
+        logger.debug('evicting match state id=%r', id)
+        self.matches.pop(id, None)
@@ -1,12 +1,21 @@
 from dataclasses import dataclass
-from typing import Literal, TypedDict
+from typing import Literal, NotRequired, TypedDict, get_args
 
 type Color = Literal['white', 'black']
 type Winner = Literal['white', 'black', 'draw']
-type Reason = Literal['resign', 'points']
+type Reason = Literal['resign', 'points', 'time', 'forfeit']
+type EventName = Literal[
+    'match_start',
+    'match_time',
+    'match_move',
+    'match_chat',
+    'match_end',
+]
 
+event_names: list[str] = list(get_args(EventName.__value__))
 
-@dataclass
+
+@dataclass(frozen=True)
 class Result:
     winner: Winner
     reason: Reason | None = None
@@ -39,6 +48,8 @@ class MinifoxMatchStart(TypedDict):
     white: MinifoxPlayer
     settings: MinifoxSettings
     time_control: MinifoxTimeControl
+    # name of the minifox source, when running with several sources
+    source: NotRequired[str]
 
 
 class MinifoxMatchMove(TypedDict):
@@ -46,6 +57,7 @@ class MinifoxMatchMove(TypedDict):
     move: tuple[int, int]
     move_number: int
     turn: Literal['B', 'W']
+    source: NotRequired[str]
 
 
 class MinifoxTime(TypedDict):
@@ -60,6 +72,7 @@ class MinifoxMatchTime(TypedDict):
     id: str
     black_time: MinifoxTime
     white_time: MinifoxTime
+    source: NotRequired[str]
 
 
 class MinifoxMatchChat(TypedDict):
@@ -68,8 +81,10 @@ class MinifoxMatchChat(TypedDict):
     nick: str
     rank: str
     message: str
+    source: NotRequired[str]
 
 
 class MinifoxMatchEnd(TypedDict):
     id: str
     result: str
+    source: NotRequired[str]
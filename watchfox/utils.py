@@ -1,9 +1,12 @@
 import logging
+import math
 import re
 import time
-from typing import Iterator, cast, Final
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Final, Iterator, Literal, cast
 
-from watchfox.types import Color, MinifoxMatchStart, Result
+from watchfox.types import Color, MinifoxMatchStart, Reason, Result
 
 logger = logging.getLogger(__name__)
 
@@ -14,29 +17,142 @@ def sleep_iterator[T](it: Iterator[T], sleep: float) -> Iterator[T]:
         yield item
 
 
+@dataclass
+class LagStats:
+    count: int = 0
+    late: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    # lags below this many seconds are scheduling noise
+    tolerance: float = 0.001
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.late if self.late > 0 else 0.0
+
+    def add(self, lag: float):
+        self.count += 1
+        if lag > self.tolerance:
+            self.late += 1
+            self.total += lag
+            self.max = max(self.max, lag)
+
+    def __str__(self) -> str:
+        return (
+            f'{self.late}/{self.count} items late, '
+            f'mean lag {self.mean:.3f}s, max lag {self.max:.3f}s'
+        )
+
+
+def timed_iterator[T](
+    it: Iterator[T],
+    timestamp: Callable[[T], float],
+    speed: float = 1.0,
+    stats: LagStats | None = None,
+) -> Iterator[T]:
+    """Yield items reproducing the gaps between their timestamps.
+
+    Each item is scheduled against a monotonic clock relative to the first
+    item, so time spent by the consumer does not accumulate as drift.  Items
+    which are already overdue are yielded immediately, and their lag is
+    registered in `stats`.  An infinite `speed` yields items without waiting,
+    and without lag.
+    """
+    if speed <= 0.0:
+        raise ValueError(f'invalid {speed=}')
+
+    if stats is None:
+        stats = LagStats()
+
+    t0: float | None = None
+    clock0 = 0.0
+
+    for item in it:
+        if t0 is None:
+            t0 = timestamp(item)
+            clock0 = time.monotonic()
+
+        if math.isinf(speed):
+            # items are never late without pacing
+            stats.add(0.0)
+        else:
+            target = clock0 + (timestamp(item) - t0) / speed
+            delay = target - time.monotonic()
+            if delay > 0.0:
+                time.sleep(delay)
+            stats.add(-delay)
+
+        yield item
+
+
 B_or_W_to_winner: Final[dict[str, Color]] = {'B': 'black', 'W': 'white'}
 
+# e.g., `Draw`, `B+ Resign`, `W+T`, `B+12.5`, `W+ 3.5 points`, `B+`
+result_pattern: Final = re.compile(
+    r"""
+    \s*
+    (?: (?P<winner>[BW]) \+ \s* )?
+    (?:
+        (?P<points>\d+(?:\.\d+)?) (?: \s* (?:points?|pts\.?) )?
+      | (?P<reason>[a-z]+)
+    )?
+    \s*
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+result_reasons: Final[dict[str, Reason | Literal['draw']]] = {
+    'draw': 'draw',
+    'jigo': 'draw',
+    'resign': 'resign',
+    'r': 'resign',
+    'time': 'time',
+    't': 'time',
+    'forfeit': 'forfeit',
+    'f': 'forfeit',
+}
+
 
+@lru_cache(maxsize=1024)
 def parse_result(result: str) -> Result:
-    if re.match(r'^Draw$', result):
-        return Result('draw')
+    """Parse a minifox result string.
+
+    Results are cached (and `Result` is immutable), since the same few result
+    strings come up over and over.  Raises ValueError for unknown results.
+    """
+    if (match := result_pattern.fullmatch(result)) is None:
+        raise ValueError(f'invalid {result=}')
+
+    B_or_W, points, reason = match.group('winner', 'points', 'reason')
+
+    if reason is not None:
+        try:
+            reason = result_reasons[reason.lower()]
+        except KeyError:
+            raise ValueError(f'invalid {result=}') from None
+
+    if B_or_W is None:
+        # only draws have no winner
+        if reason == 'draw' or (points is not None and float(points) == 0.0):
+            return Result('draw')
+        raise ValueError(f'invalid {result=}')
+
+    winner = B_or_W_to_winner[B_or_W.upper()]
 
-    if match := re.match(r'^(?:((B|W))\+ )?(Draw|Resign)$', result):
-        B_or_W = match.group(1)
+    if points is not None:
+        return Result(winner, 'points', float(points))
 
-        winner = B_or_W_to_winner[B_or_W]
-        return Result(winner, 'resign')
+    if reason == 'draw':
+        raise ValueError(f'invalid {result=}')
 
-    # many cases still missing for now
-    # TODO: eventually this should become a ValueError
-    raise NotImplementedError(f'invalid {result=}')
+    return Result(winner, reason)
 
 
 def get_nick_color(data: MinifoxMatchStart, nick: str) -> Color:
-    logger.info(f'searching color for {nick=}')
+    """Color played by `nick`;  receivers of events other than `match_start`
+    can use `SSEProcessor.nick_color` instead."""
     for color in ['white', 'black']:
         if data[color]['nick'] == nick:
-            logger.info(f'color for {nick=} found {color=}')
             return cast(Color, color)
 
     raise ValueError(f'{nick=} not found')